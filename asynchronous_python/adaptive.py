@@ -0,0 +1,188 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: хост временно отключён предохранителем"""
+
+
+def is_overload(error):
+    """Ошибка говорит о перегрузке сервера и запрос стоит повторить"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRY_STATUSES
+    return isinstance(
+        error,
+        (asyncio.TimeoutError, aiohttp.ClientConnectionError)
+    )
+
+
+class AimdLimiter:
+    """
+    Лимит одновременных запросов по схеме AIMD.
+
+    Пока задержка ответов не выше target_latency, лимит растёт примерно
+    на единицу за каждые limit успешных запросов. При перегрузке
+    (429/5xx/таймаут) лимит умножается на decrease, но не чаще одного
+    раза за target_latency, чтобы пачка одновременных ошибок не
+    обрушила его до минимума.
+    """
+
+    def __init__(
+        self,
+        initial,
+        minimum=1,
+        maximum=None,
+        target_latency=2.0,
+        decrease=0.5
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight < int(self.limit)
+            )
+            self.in_flight += 1
+        return time.perf_counter()
+
+    async def release(self, started, overloaded=False):
+        latency = time.perf_counter() - started
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.perf_counter()
+            if overloaded or latency > self.target_latency:
+                if now - self._last_decrease > self.target_latency:
+                    self.limit = max(
+                        self.minimum, self.limit * self.decrease
+                    )
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Предохранитель на хост.
+
+    После threshold перегрузок подряд хост отключается на reset_timeout
+    секунд, затем пропускается один пробный запрос: успех замыкает цепь,
+    ошибка снова размыкает её.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    def check(self):
+        """Бросает CircuitOpenError, если запросы к хосту запрещены"""
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            raise CircuitOpenError('хост временно отключён')
+        if self._probe:
+            raise CircuitOpenError('идёт пробный запрос')
+        self._probe = True
+
+    def record(self, overloaded):
+        self._probe = False
+        if not overloaded:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def remaining(self):
+        """Секунды до следующего пробного запроса"""
+        if self.opened_at is None:
+            return 0.0
+        return max(
+            0.0, self.reset_timeout - (time.monotonic() - self.opened_at)
+        )
+
+
+class AdaptiveClient:
+    """
+    Вызов запросов через AIMD лимит, предохранитель хоста и повторы
+    с ограниченной экспоненциальной задержкой.
+    """
+
+    def __init__(
+        self,
+        limiter,
+        retries=4,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        breaker_threshold=5,
+        breaker_reset=30.0
+    ):
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+
+    def breaker(self, host):
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(
+                self.breaker_threshold,
+                self.breaker_reset
+            )
+        return self.breakers[host]
+
+    def backoff(self, attempt):
+        """Задержка перед повтором: экспонента с полным джиттером"""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        )
+
+    async def call(self, host, request):
+        """
+        Выполняет request() с повторами.
+
+        Повторяются только перегрузки (429/5xx/таймауты/обрывы
+        соединения); после исчерпания попыток ошибка пробрасывается.
+        """
+        breaker = self.breaker(host)
+        for attempt in range(self.retries + 1):
+            try:
+                breaker.check()
+            except CircuitOpenError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(
+                    breaker.remaining() + self.backoff(attempt)
+                )
+                continue
+            started = await self.limiter.acquire()
+            overloaded = False
+            try:
+                return await request()
+            except Exception as e:
+                overloaded = is_overload(e)
+                if not overloaded or attempt == self.retries:
+                    raise
+            finally:
+                await self.limiter.release(started, overloaded)
+                breaker.record(overloaded)
+            await asyncio.sleep(self.backoff(attempt))
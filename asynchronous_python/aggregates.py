@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+from sqlalchemy import delete, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from db_config import db_config
+from models import (
+    RESULT_COLUMNS,
+    SpimexDailyBasisTotal,
+    SpimexDailyOilTotal,
+    SpimexDailyTotal,
+    SpimexTraidingResult
+)
+
+
+# Таблица агрегатов и поля группировки кроме даты
+AGGREGATES = (
+    (SpimexDailyTotal, ()),
+    (SpimexDailyOilTotal, ('oil_id',)),
+    (SpimexDailyBasisTotal, ('delivery_basis_id',)),
+)
+MEASURES = ('volume', 'total', 'count')
+KEY_CHUNK = 2000
+
+
+def _deltas(rows, sign, deltas=None):
+    """Суммы строк rows по ключам каждой таблицы агрегатов со знаком sign"""
+    deltas = deltas or {
+        model: defaultdict(lambda: [0, 0, 0, 0]) for model, _ in AGGREGATES
+    }
+    for row in rows:
+        values = dict(zip(RESULT_COLUMNS, row))
+        if values['date'] is None:
+            continue
+        for model, group_by in AGGREGATES:
+            delta = deltas[model][
+                (values['date'],) + tuple(values[name] for name in group_by)
+            ]
+            for i, name in enumerate(MEASURES):
+                delta[i] += sign * values[name]
+            delta[3] += sign
+    return deltas
+
+
+async def _existing_rows(db, rows):
+    """Строки таблицы, которые будут перезаписаны upsert'ом rows"""
+    product_index = RESULT_COLUMNS.index('exchange_product_id')
+    date_index = RESULT_COLUMNS.index('date')
+    keys = list({(row[product_index], row[date_index]) for row in rows})
+    columns = [
+        getattr(SpimexTraidingResult, name) for name in RESULT_COLUMNS
+    ]
+    existing = []
+    for start in range(0, len(keys), KEY_CHUNK):
+        result = await db.execute(select(*columns).where(
+            tuple_(
+                SpimexTraidingResult.exchange_product_id,
+                SpimexTraidingResult.date
+            ).in_(keys[start:start + KEY_CHUNK])
+        ))
+        existing.extend(tuple(row) for row in result.all())
+    return existing
+
+
+async def _merge(db, deltas):
+    """Прибавляет дельты к таблицам агрегатов"""
+    for model, group_by in AGGREGATES:
+        values = [
+            {
+                **dict(zip(('date',) + group_by, key)),
+                **dict(zip(MEASURES + ('rows',), delta)),
+            }
+            for key, delta in deltas[model].items() if any(delta)
+        ]
+        table = model.__table__
+        # Ключи пишутся частями: у asyncpg не больше 32767 параметров
+        # в запросе, а пакет из LIMIT_SAVE отчётов даёт десятки тысяч
+        for start in range(0, len(values), KEY_CHUNK):
+            statement = insert(model).values(
+                values[start:start + KEY_CHUNK]
+            )
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=['date', *group_by],
+                set_={
+                    name: table.c[name] + statement.excluded[name]
+                    for name in MEASURES + ('rows',)
+                }
+            ))
+
+
+async def update_aggregates(db, batch):
+    """
+    Обновляет агрегаты по пакету строк в текущей транзакции.
+
+    Вызывается до записи пакета: строки, которые upsert перезапишет,
+    вычитаются из агрегатов, новые строки прибавляются.
+    """
+    if not batch:
+        return
+    rows = batch.unique_rows()
+    deltas = _deltas(await _existing_rows(db, rows), -1)
+    await _merge(db, _deltas(rows, 1, deltas))
+
+
+async def delete_aggregates(db, date):
+    """Удаляет агрегаты за дату, строки которой заменяются целиком"""
+    for model, _ in AGGREGATES:
+        await db.execute(delete(model).where(model.date == date))
+
+
+async def rebuild_month(session_maker, month):
+    """Пересчитывает агрегаты за месяц по сырым строкам"""
+    async with session_maker() as db:
+        async with db.begin():
+            for model, group_by in AGGREGATES:
+                await db.execute(
+                    text(
+                        f'DELETE FROM {model.__tablename__} '
+                        "WHERE date >= CAST(:month AS date) "
+                        "AND date < CAST(:month AS date) "
+                        "+ interval '1 month'"
+                    ),
+                    {'month': month}
+                )
+                columns = ', '.join(('date',) + group_by)
+                await db.execute(
+                    text(
+                        f'INSERT INTO {model.__tablename__} '
+                        f'({columns}, volume, total, count, rows) '
+                        f'SELECT {columns}, sum(volume), sum(total), '
+                        'sum(count), count(*) '
+                        f'FROM {SpimexTraidingResult.__tablename__} '
+                        "WHERE date >= CAST(:month AS date) "
+                        "AND date < CAST(:month AS date) "
+                        "+ interval '1 month' "
+                        f'GROUP BY {columns}'
+                    ),
+                    {'month': month}
+                )
+    print(f'Агрегаты за {month:%Y-%m} пересчитаны')
+
+
+async def rebuild(workers):
+    """Пересчитывает все агрегаты с нуля, параллельно по месяцам"""
+    session_maker = await db_config.init_db()
+    await db_config.create_tables()
+    try:
+        async with session_maker() as db:
+            result = await db.execute(
+                select(
+                    func.date_trunc('month', SpimexTraidingResult.date)
+                ).where(
+                    SpimexTraidingResult.date.is_not(None)
+                ).distinct()
+            )
+            months = sorted(day.date() for day in result.scalars())
+            # Агрегаты месяцев, от которых не осталось сырых строк,
+            # не пересчитываются и удаляются сразу
+            for model, _ in AGGREGATES:
+                await db.execute(delete(model).where(
+                    func.date_trunc('month', model.date).not_in(months)
+                ))
+            await db.commit()
+        semaphore = asyncio.Semaphore(workers)
+
+        async def run(month):
+            async with semaphore:
+                await rebuild_month(session_maker, month)
+
+        await asyncio.gather(*[run(month) for month in months])
+    finally:
+        await db_config.async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Пересчёт дневных агрегатов итогов торгов'
+    )
+    parser.add_argument(
+        'command',
+        choices=('rebuild',),
+        help='rebuild - пересчитать агрегаты с нуля'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='число месяцев, пересчитываемых одновременно'
+    )
+    args = parser.parse_args()
+    t0 = time.time()
+    asyncio.run(rebuild(args.workers))
+    print(time.time() - t0)
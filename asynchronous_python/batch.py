@@ -0,0 +1,58 @@
+from models import RESULT_COLUMNS
+
+
+class TradingBatch:
+    """
+    Колоночный пакет строк итогов торгов.
+
+    Каждое поле из RESULT_COLUMNS хранится отдельным списком, поэтому
+    пакет дёшево передаётся между процессами и объединяется с другими.
+    """
+
+    __slots__ = ('columns',)
+
+    def __init__(self, columns=None):
+        self.columns = columns or {name: [] for name in RESULT_COLUMNS}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Пакет из кортежей в порядке RESULT_COLUMNS"""
+        columns = [list(column) for column in zip(*rows)] or [
+            [] for _ in RESULT_COLUMNS
+        ]
+        return cls(dict(zip(RESULT_COLUMNS, columns)))
+
+    def __len__(self):
+        return len(self.columns[RESULT_COLUMNS[0]])
+
+    def __getstate__(self):
+        return self.columns
+
+    def __setstate__(self, state):
+        self.columns = state
+
+    def rows(self):
+        """Кортежи строк в порядке RESULT_COLUMNS"""
+        return zip(*(self.columns[name] for name in RESULT_COLUMNS))
+
+    def unique_rows(self):
+        """
+        Строки без повторов естественного ключа (продукт, дата).
+
+        При повторе остаётся последняя строка: INSERT ... ON CONFLICT
+        не может обновить одну строку таблицы дважды за один запрос.
+        """
+        key_index = (
+            RESULT_COLUMNS.index('exchange_product_id'),
+            RESULT_COLUMNS.index('date'),
+        )
+        unique = {
+            (row[key_index[0]], row[key_index[1]]): row
+            for row in self.rows()
+        }
+        return list(unique.values())
+
+    def extend(self, other):
+        """Дописывает в пакет строки другого пакета"""
+        for name in RESULT_COLUMNS:
+            self.columns[name].extend(other.columns[name])
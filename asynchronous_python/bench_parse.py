@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import xlrd
+
+import constants
+from pars import PARSE_POOLS, pars_xls, parse_xls_sync
+
+
+def parse_xls_loop(source):
+    """Прежний построчный парсер, для сравнения с колоночным"""
+    wb = xlrd.open_workbook(file_contents=source)
+    sheet = wb.sheet_by_index(0)
+    date_str = sheet.cell_value(3, 1)[13:]
+    try:
+        date = datetime.strptime(date_str, "%d.%m.%Y").date()
+    except ValueError:
+        date = None
+    rows = []
+    row = constants.START_ROW
+    while sheet.cell_value(row, constants.FIRST_COLUMN) != 'Итого:':
+        product = sheet.cell_value(row, constants.FIRST_COLUMN)
+        count_contract = sheet.cell_value(row, constants.COLUMN_CONTRACT)
+        if len(product) != 11 or count_contract == '-':
+            row += 1
+            continue
+        rows.append((
+            product,
+            sheet.cell_value(row, constants.FIRST_COLUMN+1),
+            product[:4],
+            product[4:7],
+            sheet.cell_value(row, constants.FIRST_COLUMN+2),
+            product[-1],
+            int(sheet.cell_value(row, constants.FIRST_COLUMN+3)),
+            int(sheet.cell_value(row, constants.FIRST_COLUMN+4)),
+            int(count_contract),
+            date,
+        ))
+        row += 1
+    return rows
+
+
+def measure_parser(parse, sheets):
+    """
+    Скорость разбора таблицы без учёта чтения файла xlrd.
+
+    Книги открываются заранее, а open_workbook подменяется на возврат
+    готовой книги, чтобы сравнивать только обход ячеек.
+    """
+    open_workbook = xlrd.open_workbook
+    books = iter(sheets)
+    xlrd.open_workbook = lambda *args, **kwargs: next(books)
+    try:
+        t0 = time.perf_counter()
+        rows = sum(len(parse(b'') or ()) for _ in range(len(sheets)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        xlrd.open_workbook = open_workbook
+    return rows, elapsed
+
+
+async def measure(pool_class, workers, sources):
+    """Время парсинга всех файлов в пуле заданного типа"""
+    loop = asyncio.get_running_loop()
+    with pool_class(workers) as pool:
+        # Прогрев пула, чтобы не учитывать запуск процессов
+        await asyncio.gather(*[
+            pars_xls(source, pool, loop) for source in sources[:workers]
+        ])
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*[
+            pars_xls(source, pool, loop) for source in sources
+        ])
+        elapsed = time.perf_counter() - t0
+    rows = sum(len(result or ()) for result in results)
+    return rows, elapsed
+
+
+async def main(paths, workers, repeat):
+    sources = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+    sources *= repeat
+    for name, parse in (
+        ('loop', parse_xls_loop),
+        ('columns', parse_xls_sync),
+    ):
+        books = [xlrd.open_workbook(file_contents=s) for s in sources]
+        rows, elapsed = measure_parser(parse, books)
+        print(
+            f'{name:>7}: {rows} строк за {elapsed:.3f} сек, '
+            f'{rows / elapsed:,.0f} строк/сек'
+        )
+    timings = {}
+    for name, pool_class in PARSE_POOLS.items():
+        rows, elapsed = await measure(pool_class, workers, sources)
+        timings[name] = elapsed
+        print(
+            f'{name:>7}: {len(sources)} файлов, {rows} строк '
+            f'за {elapsed:.3f} сек, {rows / elapsed:,.0f} строк/сек'
+        )
+    speedup = timings['thread'] / timings['process']
+    print(f'Ускорение process/thread: {speedup:.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Скорость парсинга XLS: построчно и по столбцам, '
+        'в пуле потоков и процессов'
+    )
+    parser.add_argument('paths', nargs='+', help='XLS файлы отчётов')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.paths, args.workers, args.repeat))
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+
+from db_config import db_config
+
+
+PLAIN = 'bench_results_plain'
+PARTITIONED = 'bench_results_partitioned'
+
+COLUMNS = '''
+    id serial,
+    exchange_product_id varchar NOT NULL,
+    exchange_product_name varchar NOT NULL,
+    oil_id varchar(4) NOT NULL,
+    delivery_basis_id varchar(3) NOT NULL,
+    delivery_basis_name varchar NOT NULL,
+    delivery_type_id varchar(1) NOT NULL,
+    volume integer NOT NULL,
+    total integer NOT NULL,
+    count integer NOT NULL,
+    date date NOT NULL
+'''
+
+INDEXES = (
+    ('date', 'date'),
+    ('oil_date', 'oil_id, date'),
+    ('basis_date', 'delivery_basis_id, date'),
+    ('type_date', 'delivery_type_id, date'),
+)
+
+QUERIES = {
+    'oil_id за месяц': (
+        'SELECT sum(volume), sum(total) FROM {table} '
+        "WHERE oil_id = 'A042' "
+        "AND date >= '{month}' AND date < '{next_month}'"
+    ),
+    'базис за квартал': (
+        'SELECT date, sum(volume) FROM {table} '
+        "WHERE delivery_basis_id = 'C02' "
+        "AND date >= '{quarter}' AND date < '{next_quarter}' "
+        'GROUP BY date ORDER BY date'
+    ),
+    'тип поставки за день': (
+        'SELECT * FROM {table} '
+        "WHERE delivery_type_id = 'F' AND date = '{day}'"
+    ),
+    'последние 10 дат': (
+        'SELECT DISTINCT date FROM {table} ORDER BY date DESC LIMIT 10'
+    ),
+}
+
+
+def query_dates(start, end):
+    """
+    Даты фильтров QUERIES внутри сгенерированного диапазона.
+
+    Квартал берётся из первого года, месяц - из предпоследнего,
+    день - из последнего, поэтому запросы находят строки при любом --years.
+    """
+    month = date(max(start.year, end.year - 1), 3, 1)
+    return {
+        'quarter': start,
+        'next_quarter': date(start.year, 4, 1),
+        'month': month,
+        'next_month': date(month.year, 4, 1),
+        'day': date(end.year, 6, 14),
+    }
+
+
+def months(start, end):
+    """Первые числа месяцев от start до end включительно"""
+    year, month = start.year, start.month
+    while date(year, month, 1) <= end:
+        yield date(year, month, 1)
+        year, month = year + month // 12, month % 12 + 1
+
+
+async def create_tables(conn, start, end, products):
+    """Создаёт обычную и секционированную таблицы с одинаковыми данными"""
+    await conn.execute(f'DROP TABLE IF EXISTS {PLAIN}, {PARTITIONED}')
+    await conn.execute(f'CREATE TABLE {PLAIN} ({COLUMNS}, PRIMARY KEY (id))')
+    await conn.execute(
+        f'CREATE TABLE {PARTITIONED} ({COLUMNS}, PRIMARY KEY (id, date)) '
+        'PARTITION BY RANGE (date)'
+    )
+    for month in months(start, end):
+        next_month = date(
+            month.year + month.month // 12, month.month % 12 + 1, 1
+        )
+        await conn.execute(
+            f'CREATE TABLE {PARTITIONED}_{month:%Y_%m} '
+            f'PARTITION OF {PARTITIONED} '
+            f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        )
+    for table in (PLAIN, PARTITIONED):
+        await conn.execute(
+            f'INSERT INTO {table} (exchange_product_id, '
+            'exchange_product_name, oil_id, delivery_basis_id, '
+            'delivery_basis_name, delivery_type_id, volume, total, count, '
+            'date) '
+            'SELECT p.oil || p.basis || lpad((p.i % 1000)::text, 3, $4) '
+            '|| p.type, $5 || p.i, p.oil, p.basis, $6 || p.basis, p.type, '
+            '(random() * 1000)::int, (random() * 1000000)::int, '
+            '(random() * 50)::int + 1, d::date '
+            'FROM generate_series($1::date, $2::date, $7::interval) d, ('
+            "SELECT i, 'A' || lpad((i % 300)::text, 3, '0') AS oil, "
+            "chr(65 + i % 20) || lpad((i % 50)::text, 2, '0') AS basis, "
+            "substr('ABFGW', i % 5 + 1, 1) AS type "
+            'FROM generate_series(1, $3::int) i) p',
+            start, end, products, '0', 'Продукт ', 'Базис ',
+            timedelta(days=1)
+        )
+        for name, columns in INDEXES:
+            await conn.execute(
+                f'CREATE INDEX ix_{table}_{name} ON {table} ({columns})'
+            )
+        await conn.execute(f'ANALYZE {table}')
+
+
+async def measure(conn, query, repeat):
+    """Медиана времени выполнения запроса"""
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await conn.fetch(query)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings)
+
+
+async def main(years, products, repeat, keep):
+    await db_config.init_db()
+    end = date(2024, 12, 31)
+    start = date(end.year - years + 1, 1, 1)
+    try:
+        async with db_config.async_engine.connect() as connection:
+            raw_connection = await connection.get_raw_connection()
+            conn = raw_connection.driver_connection
+            t0 = time.perf_counter()
+            await create_tables(conn, start, end, products)
+            rows = await conn.fetchval(f'SELECT count(*) FROM {PLAIN}')
+            print(
+                f'Сгенерировано {rows:,} строк за {years} лет '
+                f'за {time.perf_counter() - t0:.1f} сек'
+            )
+            dates = query_dates(start, end)
+            for name, query in QUERIES.items():
+                plain = await measure(
+                    conn, query.format(table=PLAIN, **dates), repeat
+                )
+                partitioned = await measure(
+                    conn, query.format(table=PARTITIONED, **dates), repeat
+                )
+                print(
+                    f'{name:>22}: обычная {plain * 1000:8.2f} мс, '
+                    f'секционированная {partitioned * 1000:8.2f} мс'
+                )
+            if not keep:
+                await conn.execute(f'DROP TABLE {PLAIN}, {PARTITIONED}')
+            await connection.commit()
+    finally:
+        await db_config.async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Скорость типичных фильтров по spimex_trading_results '
+        'на обычной и секционированной таблице'
+    )
+    parser.add_argument('--years', type=int, default=4)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument(
+        '--keep',
+        action='store_true',
+        help='не удалять таблицы бенчмарка после замера'
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.years, args.products, args.repeat, args.keep))
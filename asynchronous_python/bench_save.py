@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from batch import TradingBatch
+from db_config import db_config
+from models import SpimexTraidingResult
+from pars import SAVERS
+
+
+def make_rows(count, seed=0):
+    """Синтетические строки в формате parse_xls_sync"""
+    rnd = random.Random(seed)
+    start = date(2023, 1, 1)
+    rows = []
+    for i in range(count):
+        oil_id = f'A{rnd.randint(0, 999):03d}'
+        basis_id = f'{rnd.choice("ABCDEFGHIJ")}{rnd.randint(0, 99):02d}'
+        product = f'{oil_id}{basis_id}{rnd.randint(0, 999):03d}F'
+        rows.append((
+            product,
+            f'Бензин {product}',
+            oil_id,
+            basis_id,
+            f'Базис {basis_id}',
+            product[-1],
+            rnd.randint(1, 10_000),
+            rnd.randint(1, 10_000_000),
+            rnd.randint(1, 100),
+            start + timedelta(days=i % 700),
+        ))
+    return TradingBatch.from_rows(rows)
+
+
+async def count_rows(session_maker):
+    """Число строк в spimex_trading_results"""
+    async with session_maker() as db:
+        return await db.scalar(
+            select(func.count()).select_from(SpimexTraidingResult)
+        )
+
+
+async def measure(save_data, session_maker, rows):
+    """
+    Время записи строк одним из способов, транзакция откатывается.
+
+    До первого запроса SQLAlchemy драйвер asyncpg не отправляет BEGIN,
+    и COPY через сырое соединение выполнился бы в автокоммите, поэтому
+    транзакция открывается запросом SELECT 1.
+    """
+    before = await count_rows(session_maker)
+    async with session_maker() as db:
+        await db.begin()
+        await db.execute(select(1))
+        t0 = time.perf_counter()
+        await save_data(db, rows)
+        await db.flush()
+        elapsed = time.perf_counter() - t0
+        await db.rollback()
+    after = await count_rows(session_maker)
+    if after != before:
+        raise RuntimeError(
+            f'замер изменил таблицу: было {before} строк, стало {after}'
+        )
+    return elapsed
+
+
+async def main(count, repeat):
+    session_maker = await db_config.init_db()
+    await db_config.create_tables()
+    rows = make_rows(count)
+    try:
+        for name, save_data in SAVERS.items():
+            best = min([
+                await measure(save_data, session_maker, rows)
+                for _ in range(repeat)
+            ])
+            print(
+                f'{name:>5}: {count} строк за {best:.3f} сек, '
+                f'{count / best:,.0f} строк/сек'
+            )
+    finally:
+        await db_config.async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Сравнение скорости записи ORM и COPY'
+    )
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
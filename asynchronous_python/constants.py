@@ -1,5 +1,17 @@
+from datetime import date
+
 UNIT_MEASURE = (5, 1)
 FIRST_COLUMN = 1
 COLUMN_CONTRACT = 14
 START_ROW = 8
 LIMIT_SAVE = 100
+# Пакет записи: не больше LIMIT_SAVE отчётов и BATCH_ROWS строк,
+# ожидание первого отчёта пакета не дольше BATCH_INTERVAL секунд
+BATCH_ROWS = 50000
+BATCH_INTERVAL = 2.0
+SPILL_SIZE = 8 * 1024 * 1024
+PAGE_WINDOW = 4
+# Отчёты старше имеют другую разметку, по умолчанию обход до них
+REPORTS_SINCE = date(2023, 1, 1)
+# Сколько запусков подряд повторять не скачанный или не записанный отчёт
+FAILED_REPORT_ATTEMPTS = 3
@@ -1,4 +1,6 @@
 import os
+import sys
+from pathlib import Path
 
 import asyncpg
 from dotenv import load_dotenv
@@ -8,6 +10,16 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine
 )
 
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from asynchronous_python.partitions import (
+    PARTITIONED_TABLES,
+    create_partition,
+    create_partitioned_tables,
+    missing_partitions
+)
+
 load_dotenv()
 
 
@@ -20,9 +32,21 @@ class DatabaseConfig:
         self.DB_USER = os.getenv('DB_USER', 'postgres')
         self.DB_PASS = os.getenv('DB_PASS', '')
         self.DB_NAME = os.getenv('DB_NAME', 'my_database')
+        self.POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+        self.MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        self.POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '0') == '1'
+        self.POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+        self.STATEMENT_CACHE_SIZE = int(
+            os.getenv('DB_STATEMENT_CACHE_SIZE', '100')
+        )
+        # 0 - не проверять наличие БД при старте (она уже создана)
+        self.CHECK_DATABASE = os.getenv('DB_CHECK_DATABASE', '1') == '1'
         self.Base = declarative_base()
-        self.async_engine = None
-        self.async_session = None
+        self._async_engine = None
+        self._async_session = None
+        self._database_checked = False
+        self.partitioned_tables = {}
+        self._partitions = set()
 
     def get_db_url(self, dbname=None):
         db = dbname or self.DB_NAME
@@ -66,26 +90,89 @@ class DatabaseConfig:
             if 'conn' in locals():
                 await conn.close()
 
+    @property
+    def async_engine(self):
+        """
+        Движок создаётся при первом обращении.
+
+        Размер пула, pre-ping, recycle и кеш подготовленных выражений
+        asyncpg задаются переменными окружения DB_*.
+        """
+        if self._async_engine is None:
+            self._async_engine = create_async_engine(
+                self.get_db_url() + (
+                    '?prepared_statement_cache_size='
+                    f'{self.STATEMENT_CACHE_SIZE}'
+                ),
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.MAX_OVERFLOW,
+                pool_pre_ping=self.POOL_PRE_PING,
+                pool_recycle=self.POOL_RECYCLE
+            )
+        return self._async_engine
+
+    @property
+    def async_session(self):
+        if self._async_session is None:
+            self._async_session = async_sessionmaker(
+                bind=self.async_engine,
+                expire_on_commit=False
+            )
+        return self._async_session
+
     async def init_db(self):
-        """Инициализирует подключение к БД и создаёт таблицы"""
-        db_url = self.get_db_url()
-        await self._ensure_database_exists()
-        self.async_engine = create_async_engine(db_url)
-        self.async_session = async_sessionmaker(
-            bind=self.async_engine,
-            expire_on_commit=False
-        )
+        """
+        Проверяет наличие БД и возвращает фабрику сессий.
+
+        Проверка выполняется один раз за процесс и отключается
+        DB_CHECK_DATABASE=0: лишнее подключение к postgres заметно
+        для коротких запусков загрузки.
+        """
+        if self.CHECK_DATABASE and not self._database_checked:
+            await self._ensure_database_exists()
+            self._database_checked = True
         return self.async_session
 
-    async def create_tables(self):
-        """Создаёт все таблицы в БД"""
-        if not self.async_engine:
-            await self.init_db()
+    async def create_tables(self, partitioned=False):
+        """
+        Создаёт все таблицы в БД.
+
+        При partitioned=True таблицы, у которых в info указан
+        partition_by, создаются секционированными по месяцам.
+        """
+        await self.init_db()
         try:
             async with self.async_engine.begin() as conn:
+                if partitioned:
+                    await conn.run_sync(
+                        create_partitioned_tables, self.Base.metadata
+                    )
                 await conn.run_sync(self.Base.metadata.create_all)
+                result = await conn.execute(PARTITIONED_TABLES)
+                self.partitioned_tables = dict(result.all())
         except Exception as e:
             print(f"Ошибка: {e}")
 
+    async def ensure_partitions(self, table_name, dates):
+        """
+        Создаёт недостающие месячные секции таблицы для дат dates.
+
+        Вызывается до транзакции записи: создание секции блокирует
+        родительскую таблицу.
+        """
+        if table_name not in self.partitioned_tables:
+            return
+        for key in missing_partitions(table_name, dates, self._partitions):
+            try:
+                async with self.async_engine.begin() as conn:
+                    await conn.execute(create_partition(*key))
+            except Exception as e:
+                # Секцию мог одновременно создать другой воркер, тогда
+                # IF NOT EXISTS сработает при следующей записи, а пока
+                # строки месяца попадут в секцию DEFAULT
+                print(f'Ошибка создания секции {key[1]}-{key[2]:02d}: {e}')
+                continue
+            self._partitions.add(key)
+
 
 db_config = DatabaseConfig()
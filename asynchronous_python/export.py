@@ -0,0 +1,272 @@
+"""
+Потоковая выгрузка spimex_trading_results в CSV или Parquet.
+
+CSV пишется через COPY TO STDOUT, Parquet - через серверный курсор
+пачками по --chunk строк, поэтому память не зависит от объёма выборки.
+С --split-months каждый месяц выгружается в отдельный файл
+в --workers параллельных соединениях.
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import time
+from datetime import date, timedelta
+
+from db_config import db_config
+from metrics import metrics
+from models import RESULT_COLUMNS, SpimexTraidingResult
+
+
+EXPORT_CHUNK = 50000
+# Поля фильтра по продукту и колонка таблицы
+PRODUCT_FILTERS = {
+    'product_id': 'exchange_product_id',
+    'oil_id': 'oil_id',
+    'basis_id': 'delivery_basis_id',
+    'type_id': 'delivery_type_id',
+}
+
+
+def build_filter(since=None, until=None, **filters):
+    """
+    WHERE выгрузки и параметры asyncpg ($1, $2, ...).
+
+    since и until включительно, filters - значения из PRODUCT_FILTERS,
+    None означает без фильтра.
+    """
+    conditions, args = [], []
+    for column, operator, value in (
+        ('date', '>=', since),
+        ('date', '<=', until),
+        *(
+            (column, '=', filters.get(name))
+            for name, column in PRODUCT_FILTERS.items()
+        ),
+    ):
+        if value is None:
+            continue
+        args.append(value)
+        conditions.append(f'{column} {operator} ${len(args)}')
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return where, args
+
+
+def build_query(since=None, until=None, **filters):
+    """SELECT строк выгрузки в порядке дат"""
+    where, args = build_filter(since, until, **filters)
+    return (
+        f"SELECT {', '.join(RESULT_COLUMNS)} "
+        f'FROM {SpimexTraidingResult.__tablename__}{where} '
+        'ORDER BY date'
+    ), args
+
+
+def open_output(path, compress):
+    """Файл для записи, сжатый gzip при compress"""
+    if compress:
+        return gzip.open(path, 'wb', compresslevel=6)
+    return open(path, 'wb')
+
+
+async def export_csv(connection, query, args, path, compress):
+    """COPY (query) TO STDOUT в CSV файл, возвращает число строк"""
+    with open_output(path, compress) as f:
+        status = await connection.copy_from_query(
+            query,
+            *args,
+            output=f,
+            format='csv',
+            header=True
+        )
+    return int(status.split()[-1])
+
+
+async def export_parquet(connection, query, args, path, chunk):
+    """
+    Серверный курсор в Parquet файл, пачка из chunk строк - одна
+    группа строк. Возвращает число строк.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (name, pa.string()) for name in RESULT_COLUMNS[:6]
+    ] + [
+        ('volume', pa.int64()),
+        ('total', pa.int64()),
+        ('count', pa.int64()),
+        ('date', pa.date32()),
+    ])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        async with connection.transaction():
+            cursor = await connection.cursor(query, *args)
+            while True:
+                records = await cursor.fetch(chunk)
+                if not records:
+                    break
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [
+                        pa.array(
+                            [record[i] for record in records], field.type
+                        )
+                        for i, field in enumerate(schema)
+                    ],
+                    schema=schema
+                ))
+                rows += len(records)
+    return rows
+
+
+async def export_file(path, fmt, compress, chunk, since, until, filters):
+    """Выгрузка одного файла на отдельном соединении пула"""
+    query, args = build_query(since, until, **filters)
+    with metrics.track('export') as tracked:
+        async with db_config.async_engine.connect() as connection:
+            raw_connection = await connection.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+            if fmt == 'csv':
+                rows = await export_csv(
+                    driver_connection, query, args, path, compress
+                )
+            else:
+                rows = await export_parquet(
+                    driver_connection, query, args, path, chunk
+                )
+        tracked.rows = rows
+        tracked.bytes = os.path.getsize(path)
+    print(f'{path}: {rows} строк, {tracked.bytes} байт')
+
+
+async def export_months(since, until, filters):
+    """Месяцы, в которых есть строки выгрузки"""
+    where, args = build_filter(since, until, **filters)
+    query = (
+        "SELECT DISTINCT CAST(date_trunc('month', date) AS date) AS month "
+        f'FROM {SpimexTraidingResult.__tablename__}{where} '
+        'ORDER BY month'
+    )
+    async with db_config.async_engine.connect() as connection:
+        raw_connection = await connection.get_raw_connection()
+        records = await raw_connection.driver_connection.fetch(query, *args)
+    return [record['month'] for record in records]
+
+
+def month_path(path, month):
+    """Имя файла месяца: results.csv.gz -> results_2024_05.csv.gz"""
+    directory, name = os.path.split(path)
+    stem, dot, suffix = name.partition('.')
+    return os.path.join(directory, f'{stem}_{month:%Y_%m}{dot}{suffix}')
+
+
+async def main(
+    path,
+    fmt='csv',
+    compress=False,
+    chunk=EXPORT_CHUNK,
+    since=None,
+    until=None,
+    split_months=False,
+    workers=4,
+    **filters
+):
+    await db_config.init_db()
+    try:
+        if not split_months:
+            await export_file(
+                path, fmt, compress, chunk, since, until, filters
+            )
+            return
+        semaphore = asyncio.Semaphore(workers)
+
+        async def run(month):
+            last = date(
+                month.year + month.month // 12, month.month % 12 + 1, 1
+            ) - timedelta(days=1)
+            async with semaphore:
+                await export_file(
+                    month_path(path, month),
+                    fmt,
+                    compress,
+                    chunk,
+                    max(month, since or month),
+                    min(last, until or last),
+                    filters
+                )
+
+        months = await export_months(since, until, filters)
+        await asyncio.gather(*[run(month) for month in months])
+    finally:
+        await db_config.async_engine.dispose()
+        stage = metrics.summary()['stages'].get('export')
+        if stage:
+            print(
+                f"Выгружено {stage['rows']} строк, {stage['bytes']} байт, "
+                f"{stage['rows_per_second']} строк/сек"
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('output', help='файл выгрузки')
+    parser.add_argument(
+        '--format',
+        choices=('csv', 'parquet'),
+        default='csv',
+        help='CSV через COPY или колоночный Parquet (нужен pyarrow)'
+    )
+    parser.add_argument(
+        '--gzip',
+        action='store_true',
+        help='сжимать CSV gzip'
+    )
+    parser.add_argument(
+        '--chunk',
+        type=int,
+        default=EXPORT_CHUNK,
+        help='строк в одной пачке курсора и группе строк Parquet'
+    )
+    parser.add_argument(
+        '--since',
+        type=date.fromisoformat,
+        default=None,
+        help='с даты ГГГГ-ММ-ДД включительно'
+    )
+    parser.add_argument(
+        '--until',
+        type=date.fromisoformat,
+        default=None,
+        help='по дату ГГГГ-ММ-ДД включительно'
+    )
+    for name in PRODUCT_FILTERS:
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            default=None,
+            help=f'фильтр по {PRODUCT_FILTERS[name]}'
+        )
+    parser.add_argument(
+        '--split-months',
+        action='store_true',
+        help='отдельный файл на каждый месяц'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='число месяцев, выгружаемых одновременно'
+    )
+    args = parser.parse_args()
+    t0 = time.time()
+    asyncio.run(main(
+        args.output,
+        args.format,
+        args.gzip,
+        args.chunk,
+        args.since,
+        args.until,
+        args.split_months,
+        args.workers,
+        **{name: getattr(args, name) for name in PRODUCT_FILTERS}
+    ))
+    print(time.time() - t0)
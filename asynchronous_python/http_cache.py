@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ReportCache:
+    """
+    Локальный кеш скачанных отчётов для условных HTTP запросов.
+
+    Для каждого URL (вместе с ?r=) хранится ETag, Last-Modified и sha256
+    содержимого. Само содержимое лежит в blobs/ под своим sha256, поэтому
+    одинаковые файлы хранятся один раз. Когда суммарный размер blobs
+    превышает max_bytes, удаляются давно не использованные файлы.
+    Файловые операции выполняются в пуле потоков, индекс меняется
+    в памяти и записывается на диск не чаще раза в flush_interval
+    секунд и при flush() в конце запуска.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, flush_interval=None):
+        self.cache_dir = cache_dir or os.getenv(
+            'HTTP_CACHE_DIR',
+            os.path.join(os.path.dirname(__file__), 'http_cache')
+        )
+        self.max_bytes = max_bytes or int(
+            os.getenv('HTTP_CACHE_MAX_BYTES', str(512 * 1024 * 1024))
+        )
+        self.blobs_dir = os.path.join(self.cache_dir, 'blobs')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.entries, self.blobs = self._load_index()
+        self.hits = 0
+        self.misses = 0
+        self.flush_interval = flush_interval or float(
+            os.getenv('HTTP_CACHE_FLUSH_INTERVAL', '30')
+        )
+        self.dirty = False
+        self.flushed = time.monotonic()
+
+    def _load_index(self):
+        """Читает индекс кеша, отбрасывая записи без файлов"""
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        blobs = {
+            digest: blob for digest, blob in index.get('blobs', {}).items()
+            if os.path.exists(self._blob_path(digest))
+        }
+        entries = {
+            url: entry for url, entry in index.get('entries', {}).items()
+            if entry['sha256'] in blobs
+        }
+        return entries, blobs
+
+    def _save_index(self, index):
+        """Атомарно записывает индекс, чтобы он пережил падение процесса"""
+        tmp_path = f'{self.index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    async def flush(self, force=True):
+        """
+        Записывает изменённый индекс в пуле потоков.
+
+        Без force индекс пишется не чаще раза в flush_interval секунд,
+        в конце запуска нужно вызвать flush() без аргументов.
+        """
+        if not self.dirty:
+            return
+        if not force and time.monotonic() - self.flushed < self.flush_interval:
+            return
+        # Снимок берётся в цикле событий: словари меняются другими задачами
+        index = {
+            'entries': dict(self.entries),
+            'blobs': {
+                digest: dict(blob) for digest, blob in self.blobs.items()
+            },
+        }
+        self.dirty = False
+        self.flushed = time.monotonic()
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._save_index, index
+        )
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest)
+
+    def conditional_headers(self, url):
+        """Заголовки If-None-Match / If-Modified-Since для URL"""
+        entry = self.entries.get(url)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _read_blob(self, digest, spill_size, spill_dir, prefix):
+        """Содержимое файла кеша или путь к его копии больше spill_size"""
+        path = self._blob_path(digest)
+        if spill_size is not None and os.path.getsize(path) > spill_size:
+            fd, filename = tempfile.mkstemp(
+                prefix=prefix,
+                suffix='.xls',
+                dir=spill_dir
+            )
+            os.close(fd)
+            try:
+                shutil.copyfile(path, filename)
+            except OSError:
+                os.remove(filename)
+                raise
+            return filename
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def get(self, url, spill_size=None, spill_dir=None, prefix=''):
+        """
+        Содержимое закешированного отчёта или None.
+
+        Как и при скачивании, файл больше spill_size байт не читается
+        в память, а копируется во временный файл в spill_dir и
+        возвращается путь к нему. Чтение идёт в пуле потоков, время
+        использования обновляется только в памяти.
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            self.misses += 1
+            return None
+        digest = entry['sha256']
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(
+                None,
+                self._read_blob,
+                digest,
+                spill_size,
+                spill_dir,
+                prefix
+            )
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if digest in self.blobs:
+            self.blobs[digest]['used'] = time.time()
+            self.dirty = True
+        await self.flush(force=False)
+        return body
+
+    def _digest(self, source):
+        """sha256 и размер содержимого (bytes) или файла"""
+        if isinstance(source, bytes):
+            return hashlib.sha256(source).hexdigest(), len(source)
+        sha = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest(), os.path.getsize(source)
+
+    def _write_blob(self, digest, source):
+        """Атомарно кладёт содержимое в blobs/ под его sha256"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix='.tmp')
+        try:
+            if isinstance(source, bytes):
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(source)
+            else:
+                os.close(fd)
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, self._blob_path(digest))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _remove_blobs(self, digests):
+        for digest in digests:
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+
+    async def put(self, url, source, etag=None, last_modified=None):
+        """
+        Сохраняет отчёт: source - содержимое (bytes) или путь к файлу.
+
+        Хеширование и запись файлов идут в пуле потоков.
+        """
+        if not etag and not last_modified:
+            return
+        loop = asyncio.get_running_loop()
+        digest, size = await loop.run_in_executor(None, self._digest, source)
+        if size > self.max_bytes:
+            return
+        if digest not in self.blobs:
+            await loop.run_in_executor(
+                None, self._write_blob, digest, source
+            )
+            self.blobs[digest] = {'size': size}
+        self.blobs[digest]['used'] = time.time()
+        self.entries[url] = {
+            'sha256': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+        self.dirty = True
+        evicted = self._evict()
+        if evicted:
+            await loop.run_in_executor(None, self._remove_blobs, evicted)
+        await self.flush(force=False)
+
+    def _evict(self):
+        """
+        Убирает из индекса давно не использованные файлы сверх max_bytes.
+
+        Возвращает sha256 файлов, которые нужно удалить из blobs/.
+        """
+        total = sum(blob['size'] for blob in self.blobs.values())
+        if total <= self.max_bytes:
+            return []
+        evicted = []
+        for digest in sorted(self.blobs, key=lambda d: self.blobs[d]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= self.blobs.pop(digest)['size']
+            evicted.append(digest)
+        self.entries = {
+            url: entry for url, entry in self.entries.items()
+            if entry['sha256'] in self.blobs
+        }
+        return evicted
@@ -0,0 +1,84 @@
+import os
+
+import aiohttp
+from dotenv import load_dotenv
+
+from adaptive import AdaptiveClient, AimdLimiter
+
+load_dotenv()
+
+
+class HttpConfig:
+    """Класс для конфигурации общего HTTP клиента с пулом соединений"""
+
+    def __init__(self):
+        self.LIMIT = int(os.getenv('HTTP_LIMIT', '100'))
+        self.LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', '10'))
+        self.KEEPALIVE_TIMEOUT = float(
+            os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30')
+        )
+        self.DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+        self.TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '60'))
+        self.CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+        self.READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+        self.AIMD_INITIAL = int(os.getenv('HTTP_AIMD_INITIAL', '4'))
+        self.TARGET_LATENCY = float(os.getenv('HTTP_TARGET_LATENCY', '2'))
+        self.RETRIES = int(os.getenv('HTTP_RETRIES', '4'))
+        self.BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))
+        self.BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '30'))
+        self.BREAKER_THRESHOLD = int(
+            os.getenv('HTTP_BREAKER_THRESHOLD', '5')
+        )
+        self.BREAKER_RESET = float(os.getenv('HTTP_BREAKER_RESET', '30'))
+
+    def get_timeout(self, total=None):
+        """Возвращает таймауты запроса"""
+        return aiohttp.ClientTimeout(
+            total=total or self.TOTAL_TIMEOUT,
+            connect=self.CONNECT_TIMEOUT,
+            sock_read=self.READ_TIMEOUT
+        )
+
+    def create_session(self):
+        """
+        Создаёт долгоживущую сессию для поиска страниц и скачивания файлов.
+
+        Соединения с хостом переиспользуются (keep-alive), DNS ответы
+        кешируются, а число одновременных соединений ограничено
+        на хост.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.LIMIT,
+            limit_per_host=self.LIMIT_PER_HOST,
+            keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=self.DNS_CACHE_TTL,
+            use_dns_cache=True
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.get_timeout()
+        )
+
+    def create_adaptive_client(self, max_concurrency):
+        """
+        Создаёт AIMD лимитер с повторами и предохранителем хоста.
+
+        Одновременных запросов не больше max_concurrency, начальный
+        лимит - HTTP_AIMD_INITIAL.
+        """
+        limiter = AimdLimiter(
+            initial=min(self.AIMD_INITIAL, max_concurrency),
+            maximum=max_concurrency,
+            target_latency=self.TARGET_LATENCY
+        )
+        return AdaptiveClient(
+            limiter,
+            retries=self.RETRIES,
+            backoff_base=self.BACKOFF_BASE,
+            backoff_max=self.BACKOFF_MAX,
+            breaker_threshold=self.BREAKER_THRESHOLD,
+            breaker_reset=self.BREAKER_RESET
+        )
+
+
+http_config = HttpConfig()
@@ -0,0 +1,231 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными границами корзин"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class StageMetrics:
+    """Счётчики одной стадии: задержки, объём, строки и ошибки"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = Histogram()
+        self.items = 0
+        self.errors = 0
+        self.bytes = 0
+        self.rows = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+        # Стадию могут замерять из нескольких потоков (task_02 --threads)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, bytes=0, rows=0, error=False):
+        with self._lock:
+            now = time.perf_counter()
+            self.first = self.first or now - seconds
+            self.last = now
+            self.latency.observe(seconds)
+            self.items += 1
+            self.errors += bool(error)
+            self.bytes += bytes
+            self.rows += rows
+            self.busy += seconds
+
+    def summary(self):
+        wall = (self.last - self.first) if self.first else 0.0
+        return {
+            'items': self.items,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'rows': self.rows,
+            'wall_seconds': round(wall, 3),
+            'busy_seconds': round(self.busy, 3),
+            'bytes_per_second': round(self.bytes / wall, 1) if wall else 0,
+            'rows_per_second': round(self.rows / wall, 1) if wall else 0,
+            'latency_avg': round(
+                self.latency.sum / self.latency.count, 4
+            ) if self.latency.count else 0,
+            'latency_p50': self.latency.quantile(0.5),
+            'latency_p95': self.latency.quantile(0.95),
+        }
+
+
+class Tracker:
+    """
+    Контекстный менеджер замера одного вызова стадии.
+
+    Работает и вокруг await: время считается по perf_counter.
+    Исключение внутри блока считается ошибкой стадии, а отменённый
+    вызов (например, ненужная страница, запрошенная наперёд)
+    не учитывается вовсе.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.bytes = 0
+        self.rows = 0
+        self.error = False
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(
+            exc_type, asyncio.CancelledError
+        ):
+            return False
+        self.stage.observe(
+            time.perf_counter() - self.t0,
+            self.bytes,
+            self.rows,
+            self.error or exc_type is not None
+        )
+        return False
+
+
+class Metrics:
+    """Метрики запуска парсера по стадиям, глубины очередей и датчики"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.queues = {}
+        self.gauges = {}
+        self.failures = []
+
+    def stage(self, name):
+        return self.stages.setdefault(name, StageMetrics(name))
+
+    def track(self, name):
+        """Замер вызова стадии name: with metrics.track(...) as m"""
+        return Tracker(self.stage(name))
+
+    @staticmethod
+    def _set(values, name, value):
+        current = values.setdefault(name, {'value': 0, 'max': 0})
+        current['value'] = value
+        current['max'] = max(current['max'], value)
+
+    def set_queue_depth(self, name, value):
+        """Текущая и максимальная глубина очереди стадии name"""
+        self._set(self.queues, name, value)
+
+    def set_gauge(self, name, value):
+        """
+        Текущее и максимальное значение датчика, например лимита.
+
+        Экспортируется как spimex_<name> и spimex_<name>_max.
+        """
+        self._set(self.gauges, name, value)
+
+    def record_failure(self, stage, item, error):
+        """Элемент, окончательно не обработанный стадией"""
+        self.failures.append({
+            'stage': stage,
+            'item': item,
+            'error': f'{type(error).__name__}: {error}',
+        })
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        for name, stage in self.stages.items():
+            labels = f'stage="{name}"'
+            cumulative = 0
+            for bound, count in zip(
+                stage.latency.buckets + (float('inf'),),
+                stage.latency.counts
+            ):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else bound
+                lines.append(
+                    f'spimex_stage_latency_seconds_bucket'
+                    f'{{{labels},le="{le}"}} {cumulative}'
+                )
+            lines.append(
+                f'spimex_stage_latency_seconds_sum{{{labels}}} '
+                f'{stage.latency.sum}'
+            )
+            lines.append(
+                f'spimex_stage_latency_seconds_count{{{labels}}} '
+                f'{stage.latency.count}'
+            )
+            for counter in ('errors', 'bytes', 'rows'):
+                lines.append(
+                    f'spimex_stage_{counter}_total{{{labels}}} '
+                    f'{getattr(stage, counter)}'
+                )
+        for name, depth in self.queues.items():
+            lines.append(
+                f'spimex_queue_depth{{queue="{name}"}} {depth["value"]}'
+            )
+            lines.append(
+                f'spimex_queue_depth_max{{queue="{name}"}} {depth["max"]}'
+            )
+        for name, gauge in self.gauges.items():
+            lines.append(f'spimex_{name} {gauge["value"]}')
+            lines.append(f'spimex_{name}_max {gauge["max"]}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Итог запуска для JSON отчёта"""
+        return {
+            'started': self.started,
+            'elapsed_seconds': round(time.time() - self.started, 3),
+            'stages': {
+                name: stage.summary() for name, stage in self.stages.items()
+            },
+            'queues': self.queues,
+            'gauges': self.gauges,
+            'failures': self.failures,
+        }
+
+    def write_prometheus(self, path):
+        """Атомарно записывает метрики для node_exporter textfile"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def write_summary(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+metrics = Metrics()
@@ -0,0 +1,72 @@
+"""
+Миграция уже созданных таблиц парсера.
+
+create_all не меняет существующие таблицы, поэтому уникальный ключ
+(exchange_product_id, date), на который опирается upsert, и индексы
+фильтров есть только в новых БД. Команда удаляет дубли ключа,
+оставляя последнюю вставленную строку, добавляет ограничение
+и недостающие индексы, а в spimex_failed_reports - счётчик
+попыток attempts. Повторный запуск ничего не меняет. Таблицу итогов
+пишет и парсер database/task_02, отдельная миграция ему не нужна.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import UniqueConstraint, text
+
+from db_config import db_config
+from models import SpimexFailedReport, SpimexTraidingResult
+
+
+async def migrate():
+    await db_config.init_db()
+    await db_config.create_tables()
+    table = SpimexTraidingResult.__table__
+    unique = next(
+        constraint for constraint in table.constraints
+        if isinstance(constraint, UniqueConstraint)
+    )
+    columns = [column.name for column in unique.columns]
+    try:
+        async with db_config.async_engine.begin() as conn:
+            exists = await conn.scalar(
+                text('SELECT 1 FROM pg_constraint WHERE conname = :name'),
+                {'name': unique.name}
+            )
+            if not exists:
+                # Запись в таблицу ждёт конца миграции, чтобы между
+                # удалением дублей и ALTER не появились новые
+                await conn.execute(text(
+                    f'LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE'
+                ))
+                result = await conn.execute(text(
+                    f'DELETE FROM {table.name} a USING {table.name} b '
+                    'WHERE '
+                    + ' AND '.join(f'a.{name} = b.{name}' for name in columns)
+                    + ' AND a.id < b.id'
+                ))
+                print(f'Удалено дублей: {result.rowcount}')
+                await conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD CONSTRAINT {unique.name} '
+                    f"UNIQUE ({', '.join(columns)})"
+                ))
+                print(f'Добавлено ограничение {unique.name}')
+                if result.rowcount:
+                    print('Пересчитайте агрегаты: aggregates.py rebuild')
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+            await conn.execute(text(
+                f'ALTER TABLE {SpimexFailedReport.__tablename__} '
+                'ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 1'
+            ))
+    finally:
+        await db_config.async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.parse_args()
+    t0 = time.time()
+    asyncio.run(migrate())
+    print(time.time() - t0)
@@ -1,4 +1,13 @@
-from sqlalchemy import Column, Date, DateTime, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint
+)
 from sqlalchemy.sql import func
 
 from db_config import db_config
@@ -8,6 +17,26 @@ Base = db_config.Base
 
 class SpimexTraidingResult(Base):
     __tablename__ = 'spimex_trading_results'
+    __table_args__ = (
+        UniqueConstraint(
+            'exchange_product_id',
+            'date',
+            name='uq_spimex_trading_results_product_date'
+        ),
+        Index('ix_spimex_trading_results_date', 'date'),
+        Index('ix_spimex_trading_results_oil_date', 'oil_id', 'date'),
+        Index(
+            'ix_spimex_trading_results_basis_date',
+            'delivery_basis_id',
+            'date'
+        ),
+        Index(
+            'ix_spimex_trading_results_type_date',
+            'delivery_type_id',
+            'date'
+        ),
+        {'info': {'partition_by': 'date'}},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     exchange_product_id = Column(String, nullable=False)
     exchange_product_name = Column(String, nullable=False)
@@ -25,3 +54,106 @@ class SpimexTraidingResult(Base):
         default=func.now(),
         onupdate=func.now()
     )
+
+
+# Порядок полей в строках, которые возвращает парсер
+RESULT_COLUMNS = (
+    'exchange_product_id',
+    'exchange_product_name',
+    'oil_id',
+    'delivery_basis_id',
+    'delivery_basis_name',
+    'delivery_type_id',
+    'volume',
+    'total',
+    'count',
+    'date',
+)
+
+
+class SpimexIngestedReport(Base):
+    """Отчёты, уже загруженные в spimex_trading_results"""
+    __tablename__ = 'spimex_ingested_reports'
+    date = Column(Date, primary_key=True)
+    revision = Column(String, primary_key=True)
+    rows = Column(Integer, nullable=False, default=0)
+    ingested_on = Column(DateTime, default=func.now())
+
+
+class SpimexDataVersion(Base):
+    """
+    Номер версии данных итогов торгов.
+
+    Увеличивается в каждой транзакции, записавшей строки, и по нему
+    процессы, читающие данные, сбрасывают свой кеш запросов.
+    """
+    __tablename__ = 'spimex_data_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class SpimexCrawlState(Base):
+    """
+    Даты отчётов, полностью пройденные завершёнными обходами страниц.
+
+    Каждый отчёт из [oldest, newest] загружен или записан
+    в spimex_failed_reports. Инкрементальный обход останавливается
+    на странице известных отчётов, только дойдя до newest: страницы
+    прерванного запуска такими не считаются.
+    """
+    __tablename__ = 'spimex_crawl_state'
+    id = Column(Integer, primary_key=True)
+    oldest = Column(Date, nullable=False)
+    newest = Column(Date, nullable=False)
+    crawled_on = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class SpimexFailedReport(Base):
+    """
+    Отчёты, не загруженные из-за ошибки скачивания, разбора или записи.
+
+    Инкрементальный обход не останавливается, пока не дойдёт до самой
+    старой даты отчётов, которые не скачались или не записались меньше
+    FAILED_REPORT_ATTEMPTS раз. Ошибки разбора и отчёты, исчерпавшие
+    попытки, остаются здесь для ручного разбора. Запись удаляется,
+    когда отчёт за дату загружен.
+    """
+    __tablename__ = 'spimex_failed_reports'
+    date = Column(Date, primary_key=True)
+    revision = Column(String, primary_key=True)
+    stage = Column(String, nullable=False)
+    error = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=1)
+    failed_on = Column(DateTime, default=func.now())
+
+
+class SpimexDailyTotal(Base):
+    """Итоги торгов за день"""
+    __tablename__ = 'spimex_daily_totals'
+    date = Column(Date, primary_key=True)
+    volume = Column(BigInteger, nullable=False, default=0)
+    total = Column(BigInteger, nullable=False, default=0)
+    count = Column(BigInteger, nullable=False, default=0)
+    rows = Column(Integer, nullable=False, default=0)
+
+
+class SpimexDailyOilTotal(Base):
+    """Итоги торгов за день по виду нефтепродукта"""
+    __tablename__ = 'spimex_daily_oil_totals'
+    date = Column(Date, primary_key=True)
+    oil_id = Column(String(4), primary_key=True)
+    volume = Column(BigInteger, nullable=False, default=0)
+    total = Column(BigInteger, nullable=False, default=0)
+    count = Column(BigInteger, nullable=False, default=0)
+    rows = Column(Integer, nullable=False, default=0)
+
+
+class SpimexDailyBasisTotal(Base):
+    """Итоги торгов за день по базису поставки"""
+    __tablename__ = 'spimex_daily_basis_totals'
+    date = Column(Date, primary_key=True)
+    delivery_basis_id = Column(String(3), primary_key=True)
+    volume = Column(BigInteger, nullable=False, default=0)
+    total = Column(BigInteger, nullable=False, default=0)
+    count = Column(BigInteger, nullable=False, default=0)
+    rows = Column(Integer, nullable=False, default=0)
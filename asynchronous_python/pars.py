@@ -1,175 +1,938 @@
 import os
+import argparse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from urllib.parse import urlparse
 
 import aiohttp
 import aiofiles
 from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
 import time
 import xlrd
 import re
 
 import constants
+from aggregates import delete_aggregates, update_aggregates
 from db_config import db_config
-from models import SpimexTraidingResult
+from batch import TradingBatch
+from http_cache import ReportCache
+from http_client import http_config
+from models import (
+    RESULT_COLUMNS,
+    SpimexCrawlState,
+    SpimexFailedReport,
+    SpimexIngestedReport,
+    SpimexTraidingResult
+)
+from metrics import metrics
+from pipeline import Pipeline
+from queries import bump_version
+from write_batcher import WriteBatcher
 
 
 load_dotenv()
 
 
-base_url = "https://spimex.com/markets/oil_products/trades/results/"
-url_files = "https://spimex.com"
+url_files = os.getenv('SPIMEX_URL', 'https://spimex.com')
+base_url = f"{url_files}/markets/oil_products/trades/results/"
 
 files_dir = os.path.join(os.path.dirname(__file__), 'excel_files')
 
-
-async def get_links():
-    """Генератор для получение ссылок на файлы."""
-    timeout = aiohttp.ClientTimeout(total=60)
-    page_num = 1
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        while True:
-            url = f"{base_url}?page=page-{page_num}&bxajaxid=d609bce6ada86eff0b6f7e49e6bae904"
-            try:
-                async with session.get(url) as response:
-                    html = await response.text()
-                    pattern = r'href="(/upload/reports/oil_xls/oil_xls_20(2[3-9]|[3-9]\d)\d{10}\.xls\?r=\d+)'
-                    links = re.findall(pattern, html)
-                    if not links:
-                        break
-                    for link in links:
-                        yield link
-                    page_num += 1
-            except aiohttp.ClientError as e:
-                print(f"Ошибка при запросе к {url}: {e}")
-                break
+UNIQUE_KEY = 'uq_spimex_trading_results_product_date'
+STAGE_TABLE = 'spimex_trading_results_stage'
+# Строк в одном executemany upsert'а
+UPSERT_CHUNK = 2000
+# Стадии, ошибки которых повторяются следующими запусками
+RETRY_STAGES = ('upload_xls', 'bulk_save_data')
 
 
-async def upload_xls(link):
-    timeout = aiohttp.ClientTimeout(total=60)
+def report_key(link):
+    """Дата отчёта и ревизия ?r= из ссылки"""
     date = datetime.strptime(
         re.search(r"(\d{8})", link[0]).group(1),
         "%Y%m%d"
     ).date()
-    filename = os.path.join(files_dir, f"{date}.xls")
+    revision = re.search(r"\?r=(\d+)", link[0]).group(1)
+    return date, revision
+
+
+def is_ingested(known, link):
+    """Загружена ли за дату отчёта ревизия не старше его ревизии"""
+    date, revision = report_key(link)
+    return date in known and int(revision) <= known[date]
+
+
+async def fetch_page_links(session, page_num):
+    """
+    Ссылки на файлы с одной страницы результатов.
+
+    Ошибка запроса пробрасывается, а не превращается в пустую
+    страницу: пустая страница означает конец обхода.
+    """
+    url = f"{base_url}?page=page-{page_num}&bxajaxid=d609bce6ada86eff0b6f7e49e6bae904"
+    with metrics.track('get_links') as tracked:
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                html = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Ошибка при запросе к {url}: {e}")
+            tracked.error = True
+            raise
+        pattern = r'href="(/upload/reports/oil_xls/oil_xls_(\d{8})\d{6}\.xls\?r=\d+)'
+        links = re.findall(pattern, html)
+        tracked.bytes = len(html)
+        tracked.rows = len(links)
+        return links
+
+
+def merge_covered(covered, crawled):
+    """Объединяет пройденные диапазоны дат, если они пересекаются"""
+    if covered is None:
+        return crawled
+    if crawled[0] <= covered[1] and crawled[1] >= covered[0]:
+        return min(crawled[0], covered[0]), max(crawled[1], covered[1])
+    return crawled
+
+
+async def get_links(
+    session,
+    known=None,
+    window=constants.PAGE_WINDOW,
+    since=constants.REPORTS_SINCE,
+    until=None,
+    oldest_failed=None,
+    covered=None,
+    crawl=None,
+    client=None
+):
+    """
+    Генератор для получение ссылок на файлы.
+
+    Одновременно запрашивается до window страниц вперёд, ссылки отдаются
+    в порядке страниц сразу после получения очередной страницы. Обход
+    останавливается на первой пустой странице, а если передан словарь
+    known загруженных ревизий - и на первой странице, где все отчёты
+    известны. Остановка по known возможна, только если страница дошла
+    до newest диапазона covered = (oldest, newest) прошлых завершённых
+    обходов, since не раньше его oldest и страница дошла до даты
+    oldest_failed самого старого незагруженного отчёта. Без covered
+    обход идёт до since.
+
+    Страницы запрашиваются через client.call с повторами, ошибка
+    после всех попыток пробрасывается. Если обход завершился без
+    ошибок, в crawl['covered'] записывается пройденный диапазон дат
+    с учётом covered.
+
+    Отдаются только отчёты с датой в [since, until]. Страницы идут
+    от новых отчётов к старым, поэтому обход заканчивается на первой
+    странице, где все отчёты старше since.
+    """
+    def fetch(page):
+        if client is None:
+            return fetch_page_links(session, page)
+        return client.call(
+            urlparse(base_url).netloc,
+            lambda: fetch_page_links(session, page)
+        )
+
+    page_num = 1
+    pending = deque()
+    oldest = newest = None
+    known_stop = False
+    try:
+        while True:
+            while len(pending) < window:
+                pending.append(asyncio.create_task(fetch(page_num)))
+                page_num += 1
+            links = await pending.popleft()
+            if not links:
+                break
+            dates = [report_key(link)[0] for link in links]
+            selected = [
+                link for link, day in zip(links, dates)
+                if (since is None or day >= since)
+                and (until is None or day <= until)
+            ]
+            for link in selected:
+                yield link
+            if selected:
+                days = [report_key(link)[0] for link in selected]
+                oldest = min(days)
+                newest = max(newest or oldest, max(days))
+            if since is not None and max(dates) < since:
+                break
+            # Страницы новее until не останавливают обход по known
+            if (
+                known is not None
+                and covered is not None
+                and selected
+                and all(is_ingested(known, link) for link in selected)
+                and min(dates) <= covered[1]
+                and (since is None or since >= covered[0])
+                and (oldest_failed is None or min(dates) <= oldest_failed)
+            ):
+                known_stop = True
+                break
+        if crawl is not None and newest is not None:
+            if not known_stop:
+                # Обход дошёл до since или до последней страницы
+                oldest = since or oldest
+            crawl['covered'] = merge_covered(covered, (oldest, newest))
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def upload_xls(
+    session,
+    link,
+    spill_size=constants.SPILL_SIZE,
+    cache=None
+):
+    """
+    Скачивание файла через общую HTTP сессию.
+
+    Файл собирается в памяти и возвращается как bytes. Если он больше
+    spill_size байт, содержимое сбрасывается во временный файл
+    в excel_files и возвращается путь к нему.
+    При переданном cache запрос отправляется условным, и если файл
+    не изменился (304), содержимое берётся из кеша.
+    """
+    date, _ = report_key(link)
     url = url_files + link[0]
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url) as response:
-            async with aiofiles.open(filename, 'wb') as f:
-                while True:
-                    chunk = await response.content.readany()
-                    if not chunk:
-                        break
-                    await f.write(chunk)
-    return filename
+    headers = cache.conditional_headers(url) if cache is not None else {}
+    buffer = bytearray()
+    filename = f = None
+    try:
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                body = await cache.get(
+                    url, spill_size, files_dir, f'{date}_'
+                )
+                if body is not None:
+                    return body
+                return await upload_xls(session, link, spill_size)
+            response.raise_for_status()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            while True:
+                chunk = await response.content.readany()
+                if not chunk:
+                    break
+                if f is None:
+                    if len(buffer) + len(chunk) <= spill_size:
+                        buffer += chunk
+                        continue
+                    fd, filename = tempfile.mkstemp(
+                        prefix=f'{date}_',
+                        suffix='.xls',
+                        dir=files_dir
+                    )
+                    os.close(fd)
+                    f = await aiofiles.open(filename, 'wb')
+                    await f.write(buffer)
+                    buffer = None
+                await f.write(chunk)
+    except BaseException:
+        if f is not None:
+            await f.close()
+            os.remove(filename)
+        raise
+    if f is None:
+        result = bytes(buffer)
+    else:
+        await f.close()
+        result = filename
+    if cache is not None:
+        await cache.put(url, result, etag, last_modified)
+    return result
 
 
 async def bulk_save_data(session, file_data):
+    """Сохранение строк через ORM"""
     if file_data is not None:
+        model_objects = [
+            SpimexTraidingResult(**dict(zip(RESULT_COLUMNS, row)))
+            for row in file_data.rows()
+        ]
         await session.run_sync(
             lambda sync_session: sync_session.add_all(
-                file_data
+                model_objects
             )
         )
-        await session.commit()
 
 
-async def pars_xls(file_name, pool, loop):
-    """Асинхронная обёртка для синхронного парсинга XLS"""
-    return await loop.run_in_executor(
-        pool,
-        lambda: parse_xls_sync(file_name)
+async def copy_save_data(session, file_data):
+    """Сохранение строк через COPY напрямую в asyncpg, минуя ORM"""
+    if not file_data:
+        return
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    now = datetime.now()
+    await raw_connection.driver_connection.copy_records_to_table(
+        SpimexTraidingResult.__tablename__,
+        records=[row + (now, now) for row in file_data.rows()],
+        columns=RESULT_COLUMNS + ('created_on', 'updated_on'),
+    )
+
+
+async def upsert_save_data(session, file_data):
+    """
+    Идемпотентное сохранение через INSERT ... ON CONFLICT DO UPDATE.
+
+    Строки с уже существующей парой (продукт, дата) обновляются, поэтому
+    повторный запуск и пересекающиеся воркеры не создают дублей.
+    """
+    if not file_data:
+        return
+    rows = file_data.unique_rows()
+    statement = insert(SpimexTraidingResult)
+    statement = statement.on_conflict_do_update(
+        constraint=UNIQUE_KEY,
+        set_={
+            **{
+                name: statement.excluded[name]
+                for name in RESULT_COLUMNS
+            },
+            'updated_on': func.now(),
+        }
+    )
+    # Один подготовленный запрос на пачку строк (executemany), а не
+    # INSERT ... VALUES с параметрами на каждое поле каждой строки
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        await session.execute(statement, [
+            dict(zip(RESULT_COLUMNS, row))
+            for row in rows[start:start + UPSERT_CHUNK]
+        ])
+
+
+async def copy_upsert_save_data(session, file_data):
+    """
+    Идемпотентное сохранение через COPY во временную таблицу
+    и INSERT ... SELECT ... ON CONFLICT DO UPDATE из неё.
+    """
+    if not file_data:
+        return
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+    table = SpimexTraidingResult.__tablename__
+    columns = ', '.join(RESULT_COLUMNS)
+    updates = ', '.join(
+        f'{name} = EXCLUDED.{name}' for name in RESULT_COLUMNS
     )
+    # Только колонки COPY: LIKE скопировал бы NOT NULL у id без его
+    # значения по умолчанию
+    result_table = SpimexTraidingResult.__table__
+    definition = ', '.join(
+        f'{name} {result_table.c[name].type.compile(connection.dialect)}'
+        for name in RESULT_COLUMNS
+    )
+    await driver_connection.execute(
+        f'CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} '
+        f'({definition}) ON COMMIT DELETE ROWS'
+    )
+    await driver_connection.copy_records_to_table(
+        STAGE_TABLE,
+        records=file_data.unique_rows(),
+        columns=RESULT_COLUMNS,
+    )
+    await driver_connection.execute(
+        f'INSERT INTO {table} ({columns}, created_on, updated_on) '
+        f'SELECT {columns}, now(), now() FROM {STAGE_TABLE} '
+        f'ON CONFLICT ON CONSTRAINT {UNIQUE_KEY} '
+        f'DO UPDATE SET {updates}, updated_on = now()'
+    )
+
+
+SAVERS = {
+    'upsert': upsert_save_data,
+    'copy-upsert': copy_upsert_save_data,
+    'orm': bulk_save_data,
+    'copy': copy_save_data,
+}
+
 
+async def pars_xls(source, pool, loop):
+    """
+    Асинхронная обёртка для синхронного парсинга XLS.
 
-def parse_xls_sync(file_name):
-    """Синхронный парсинг XLS файла"""
-    file = os.path.join(files_dir, f"{file_name}")
-    wb = xlrd.open_workbook(file)
+    pool может быть как пулом потоков, так и пулом процессов: в процесс
+    передаётся содержимое файла, обратно возвращается колоночный пакет.
+    """
+    return await loop.run_in_executor(pool, parse_xls_sync, source)
+
+
+PARSE_POOLS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+def parse_xls_sync(source):
+    """
+    Синхронный парсинг XLS файла в колоночный пакет TradingBatch.
+
+    source - содержимое файла (bytes) или путь к нему.
+    Таблица читается целыми столбцами: граница 'Итого:' ищется один раз,
+    а фильтры по коду продукта и числу договоров применяются сразу
+    ко всему столбцу.
+    """
+    if isinstance(source, bytes):
+        wb = xlrd.open_workbook(file_contents=source)
+    else:
+        wb = xlrd.open_workbook(os.path.join(files_dir, source))
     sheet = wb.sheet_by_index(0)
     date_str = sheet.cell_value(3, 1)[13:]
     try:
         date = datetime.strptime(date_str, "%d.%m.%Y").date()
     except ValueError:
         date = None
-    model_objects = []
-    row = constants.START_ROW
     if (
         sheet.cell_value(
             constants.UNIT_MEASURE[0],
             constants.UNIT_MEASURE[1]
-        ) == 'Единица измерения: Метрическая тонна'
+        ) != 'Единица измерения: Метрическая тонна'
     ):
-        while sheet.cell_value(row, constants.FIRST_COLUMN) != 'Итого:':
-            product = sheet.cell_value(row, constants.FIRST_COLUMN)
-            count_contract = sheet.cell_value(row, constants.COLUMN_CONTRACT)
-            if len(product) != 11 or count_contract == '-':
-                row += 1
-                continue
-            model_object = SpimexTraidingResult(
-                exchange_product_id=product,
-                exchange_product_name=sheet.cell_value(
-                    row,
-                    constants.FIRST_COLUMN+1
-                ),
-                oil_id=product[:4],
-                delivery_basis_id=product[4:7],
-                delivery_basis_name=sheet.cell_value(
-                    row,
-                    constants.FIRST_COLUMN+2
-                ),
-                delivery_type_id=product[-1],
-                volume=int(sheet.cell_value(row, constants.FIRST_COLUMN+3)),
-                total=int(sheet.cell_value(row, constants.FIRST_COLUMN+4)),
-                count=int(count_contract),
-                date=date
+        return None
+    start = constants.START_ROW
+    products = sheet.col_values(constants.FIRST_COLUMN, start)
+    try:
+        stop = start + products.index('Итого:')
+    except ValueError:
+        stop = sheet.nrows
+    products = products[:stop - start]
+    counts = sheet.col_values(constants.COLUMN_CONTRACT, start, stop)
+    keep = [
+        i for i, (product, count) in enumerate(zip(products, counts))
+        if isinstance(product, str) and len(product) == 11 and count != '-'
+    ]
+
+    def column(col):
+        values = sheet.col_values(col, start, stop)
+        return [values[i] for i in keep]
+
+    product_ids = [products[i] for i in keep]
+    return TradingBatch({
+        'exchange_product_id': product_ids,
+        'exchange_product_name': column(constants.FIRST_COLUMN+1),
+        'oil_id': [product[:4] for product in product_ids],
+        'delivery_basis_id': [product[4:7] for product in product_ids],
+        'delivery_basis_name': column(constants.FIRST_COLUMN+2),
+        'delivery_type_id': [product[-1] for product in product_ids],
+        'volume': list(map(int, column(constants.FIRST_COLUMN+3))),
+        'total': list(map(int, column(constants.FIRST_COLUMN+4))),
+        'count': [int(counts[i]) for i in keep],
+        'date': [date] * len(keep),
+    })
+
+
+async def load_ingested_reports(session_maker):
+    """Словарь дата -> последняя загруженная ревизия"""
+    async with session_maker() as db:
+        return await lock_revisions(db)
+
+
+async def lock_revisions(db, dates=None):
+    """
+    Последние загруженные ревизии дат dates (или всех дат).
+
+    Переданные даты блокируются до конца транзакции в порядке
+    возрастания, поэтому одновременные пакеты с отчётами одной даты
+    сравнивают ревизии по очереди, а не вслепую.
+    """
+    statement = select(
+        SpimexIngestedReport.date,
+        SpimexIngestedReport.revision
+    )
+    if dates is not None:
+        for day in sorted(dates):
+            await db.execute(select(func.pg_advisory_xact_lock(
+                day.toordinal()
+            )))
+        statement = statement.where(SpimexIngestedReport.date.in_(dates))
+    revisions = {}
+    for day, revision in await db.execute(statement):
+        revisions[day] = max(revisions.get(day, 0), int(revision))
+    return revisions
+
+
+async def load_oldest_failure(session_maker, since):
+    """
+    Дата самого старого отчёта не раньше since, который стоит повторить.
+
+    Повторяются только ошибки скачивания и записи, и не больше
+    FAILED_REPORT_ATTEMPTS раз: иначе один битый отчёт заставлял бы
+    каждый запуск обходить страницы до его даты.
+    """
+    async with session_maker() as db:
+        return await db.scalar(
+            select(func.min(SpimexFailedReport.date))
+            .where(
+                SpimexFailedReport.date >= since,
+                SpimexFailedReport.stage.in_(RETRY_STAGES),
+                SpimexFailedReport.attempts
+                < constants.FAILED_REPORT_ATTEMPTS
             )
-            model_objects.append(model_object)
-            row += 1
-        return model_objects
+        )
+
+
+async def load_crawl_state(session_maker):
+    """Диапазон (oldest, newest) завершённых обходов или None"""
+    async with session_maker() as db:
+        state = await db.get(SpimexCrawlState, 1)
+        return None if state is None else (state.oldest, state.newest)
+
+
+async def save_crawl_state(session_maker, covered):
+    """Запоминает диапазон дат, пройденный завершённым обходом"""
+    oldest, newest = covered
+    statement = insert(SpimexCrawlState).values(
+        id=1, oldest=oldest, newest=newest
+    )
+    async with session_maker() as db:
+        async with db.begin():
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=['id'],
+                set_={
+                    'oldest': oldest,
+                    'newest': newest,
+                    'crawled_on': func.now(),
+                }
+            ))
+
+
+async def save_failures(session_maker, failures):
+    """
+    Записывает отчёты из metrics.failures в spimex_failed_reports.
+
+    Повторная ошибка увеличивает attempts, см. load_oldest_failure.
+    """
+    rows = {}
+    for failure in failures:
+        date, revision = report_key((failure['item'],))
+        rows[date, revision] = {
+            'date': date,
+            'revision': revision,
+            'stage': failure['stage'],
+            'error': failure['error'],
+        }
+    if not rows:
+        return
+    statement = insert(SpimexFailedReport).values(list(rows.values()))
+    async with session_maker() as db:
+        async with db.begin():
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=['date', 'revision'],
+                set_={
+                    'stage': statement.excluded.stage,
+                    'error': statement.excluded.error,
+                    'attempts': SpimexFailedReport.attempts + 1,
+                    'failed_on': func.now(),
+                }
+            ))
+
+
+async def mark_ingested(db, key, data, replace):
+    """
+    Записывает отчёт в журнал загрузки.
+
+    Для новой ревизии уже загруженной даты строки этой даты и её
+    агрегаты удаляются, чтобы их заменили данные из свежего отчёта.
+    """
+    date, revision = key
+    if replace:
+        await delete_aggregates(db, date)
+        await db.execute(
+            delete(SpimexTraidingResult).where(
+                SpimexTraidingResult.date == date
+            )
+        )
+        await db.execute(
+            delete(SpimexIngestedReport).where(
+                SpimexIngestedReport.date == date
+            )
+        )
+    db.add(SpimexIngestedReport(
+        date=date,
+        revision=revision,
+        rows=len(data or ())
+    ))
+    await db.execute(
+        delete(SpimexFailedReport).where(SpimexFailedReport.date == date)
+    )
+
+
+async def download_file(http, spill_size, cache, client, link):
+    """
+    Стадия скачивания: ссылка -> (ссылка, содержимое или путь).
+
+    Одновременность скачиваний подстраивает AIMD лимит client,
+    перегрузки сервера повторяются с экспоненциальной задержкой.
+    Файл, не скачанный после всех попыток, попадает в failures отчёта
+    и в конце запуска в spimex_failed_reports: следующие
+    инкрементальные запуски дойдут до его даты и повторят его не больше
+    FAILED_REPORT_ATTEMPTS раз.
+    """
+    with metrics.track('upload_xls') as tracked:
+        try:
+            source = await client.call(
+                urlparse(url_files).netloc,
+                lambda: upload_xls(http, link, spill_size, cache)
+            )
+        except Exception as e:
+            print(f'Ошибка скачивания файла {link[0]}: {str(e)}')
+            metrics.record_failure('upload_xls', link[0], e)
+            tracked.error = True
+            return None
+        finally:
+            metrics.set_gauge('download_limit', client.limiter.limit)
+        tracked.bytes = (
+            len(source) if isinstance(source, bytes)
+            else os.path.getsize(source)
+        )
+        return link, source
+
+
+async def parse_file(pool, loop, item):
+    """Стадия парсинга: (ссылка, файл) -> (ссылка, строки)"""
+    link, source = item
+    with metrics.track('parse_xls_sync') as tracked:
+        try:
+            data = await pars_xls(source, pool, loop)
+        except Exception as e:
+            print(f'Ошибка парсинга файла {link[0]}: {str(e)}')
+            metrics.record_failure('parse_xls_sync', link[0], e)
+            tracked.error = True
+            return None
+        finally:
+            if isinstance(source, str):
+                os.remove(source)
+        tracked.rows = len(data or ())
+        return link, data
 
 
-async def process_file(link, session_maker, pool, loop):
-    """Скачивание, обработка  и сохранение одного файла в БД"""
+async def save_reports(session_maker, save_data, items):
+    """
+    Запись строк нескольких отчётов, журнала загрузки и агрегатов
+    в одной транзакции.
+
+    items - пары (ссылка, строки) из WriteBatcher. Из отчётов одной
+    даты остаётся отчёт с наибольшей ревизией ?r=, и он пишется, только
+    если загруженная ревизия даты не новее: более новая ревизия
+    заменяет строки даты, более старая пропускается. Строки всех
+    отчётов объединяются в один пакет, поэтому upsert и пересчёт
+    агрегатов выполняются одним набором запросов.
+    """
+    latest = {}
+    for link, data in items:
+        date, revision = report_key(link)
+        if date not in latest or int(revision) > int(latest[date][0][1]):
+            latest[date] = ((date, revision), link, data)
+    dates = {
+        day
+        for _, _, data in latest.values() if data
+        for day in data.columns['date']
+    }
+    if dates:
+        await db_config.ensure_partitions(
+            SpimexTraidingResult.__tablename__, dates
+        )
+    batch = TradingBatch()
+    written = False
+    async with session_maker() as db:
+        async with db.begin():
+            stored = await lock_revisions(db, latest)
+            for key, link, data in latest.values():
+                date, revision = key
+                if stored.get(date, 0) > int(revision):
+                    print(
+                        f'Файл {link[0]} пропущен: уже загружена '
+                        f'ревизия {stored[date]}'
+                    )
+                    continue
+                await mark_ingested(db, key, data, date in stored)
+                written = True
+                if data:
+                    batch.extend(data)
+            await update_aggregates(db, batch)
+            await save_data(db, batch)
+            if written:
+                # Процессы, читающие данные, сбросят кеш запросов
+                await bump_version(db)
+
+
+def acknowledge(links):
+    """Отчёты зафиксированного пакета записаны вместе с журналом загрузки"""
+    for link in links:
+        print(f'Файл {link[0]} записан')
+
+
+async def sample_queues(pipeline, metrics_file, interval=1.0):
+    """Периодически снимает глубины очередей и обновляет файл метрик"""
+    while True:
+        for name, depth in pipeline.queue_depths().items():
+            metrics.set_queue_depth(name, depth)
+        if metrics_file:
+            metrics.write_prometheus(metrics_file)
+        await asyncio.sleep(interval)
+
+
+async def new_links(
+    http,
+    known,
+    incremental,
+    page_window,
+    since,
+    until,
+    oldest_failed,
+    covered,
+    crawl,
+    client
+):
+    """
+    Стадия поиска страниц: ссылки на ещё не загруженные отчёты.
+
+    Ошибка обхода не обрывает конвейер: уже найденные отчёты
+    дописываются, а ошибка сохраняется в crawl['error'].
+    """
     try:
-        file_name = await upload_xls(link)
-        data = await pars_xls(file_name, pool, loop)
-        async with session_maker() as db:
-            async with db.begin():
-                await bulk_save_data(db, data)
+        async for link in get_links(
+            http,
+            known if incremental else None,
+            page_window,
+            since,
+            until,
+            oldest_failed,
+            covered,
+            crawl,
+            client
+        ):
+            if incremental and is_ingested(known, link):
+                continue
+            yield link
     except Exception as e:
-        print(f'Ошибка обработки файла {file_name}: {str(e)}')
+        print(f'Обход страниц прерван: {e}')
+        crawl['error'] = e
 
 
-async def main():
+async def main(
+    loader='upsert',
+    incremental=True,
+    in_memory=True,
+    parse_mode='thread',
+    parse_workers=None,
+    download_workers=10,
+    write_workers=2,
+    queue_size=None,
+    page_window=constants.PAGE_WINDOW,
+    use_cache=True,
+    partitioned=False,
+    metrics_file=None,
+    summary_file=None,
+    since=constants.REPORTS_SINCE,
+    until=None
+):
+    """Загрузка отчётов; возвращает 1, если обход страниц прерван"""
+    save_data = SAVERS[loader]
+    parse_workers = parse_workers or os.cpu_count()
+    crawl = {}
     try:
         session_maker = await db_config.init_db()
-        await db_config.create_tables()
+        await db_config.create_tables(partitioned)
+        known = await load_ingested_reports(session_maker)
+        oldest_failed = await load_oldest_failure(session_maker, since)
+        covered = await load_crawl_state(session_maker)
         loop = asyncio.get_running_loop()
-        with ThreadPoolExecutor() as pool:
-            semaphore = asyncio.Semaphore(10)
-            tasks = []
-            async for link in get_links():
-                async with semaphore:
-                    task = asyncio.create_task(
-                        process_file(link, session_maker, pool, loop)
+        with PARSE_POOLS[parse_mode](parse_workers) as pool:
+            async with http_config.create_session() as http:
+                spill_size = constants.SPILL_SIZE if in_memory else 0
+                cache = ReportCache() if use_cache else None
+                client = http_config.create_adaptive_client(download_workers)
+                batcher = WriteBatcher(
+                    partial(save_reports, session_maker, save_data),
+                    on_commit=acknowledge
+                ).start()
+                pipeline = Pipeline().add_stage(
+                    'download',
+                    partial(download_file, http, spill_size, cache, client),
+                    download_workers,
+                    queue_size
+                ).add_stage(
+                    'parse',
+                    partial(parse_file, pool, loop),
+                    parse_workers,
+                    queue_size
+                ).add_stage(
+                    'write',
+                    lambda item: batcher.add(*item),
+                    write_workers,
+                    queue_size
+                )
+                sampler = asyncio.create_task(
+                    sample_queues(pipeline, metrics_file)
+                )
+                completed = False
+                try:
+                    await pipeline.run(
+                        new_links(
+                            http, known, incremental, page_window,
+                            since, until, oldest_failed, covered, crawl,
+                            client
+                        )
                     )
-                    tasks.append(task)
-            await asyncio.gather(*tasks)
+                    completed = 'error' not in crawl
+                finally:
+                    sampler.cancel()
+                    await batcher.close()
+                    if cache is not None:
+                        await cache.flush()
+                    await save_failures(session_maker, metrics.failures)
+                    # Диапазон считается пройденным, только если обход
+                    # завершился и все найденные отчёты дошли до записи
+                    if completed and 'covered' in crawl:
+                        await save_crawl_state(
+                            session_maker, crawl['covered']
+                        )
     except Exception as e:
         print(f"Ошибка: {e}")
+        crawl['error'] = e
     finally:
         await db_config.async_engine.dispose()
-        for filename in os.listdir(files_dir):
-            if filename.endswith(".xls"):
-                file_path = os.path.join(files_dir, filename)
-                os.remove(file_path)
+        if metrics_file:
+            metrics.write_prometheus(metrics_file)
+        if summary_file:
+            metrics.write_summary(summary_file)
+        for name, stage in metrics.summary()['stages'].items():
+            print(
+                f"{name}: {stage['items']} вызовов, "
+                f"{stage['errors']} ошибок, "
+                f"{stage['rows_per_second']} строк/сек, "
+                f"{stage['bytes_per_second']} байт/сек"
+            )
+        for failure in metrics.failures:
+            print(
+                f"Не обработан {failure['item']} "
+                f"на стадии {failure['stage']}: {failure['error']}"
+            )
+    return 1 if 'error' in crawl else 0
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Парсер итогов торгов SPIMEX')
+    parser.add_argument(
+        '--loader',
+        choices=SAVERS,
+        default='upsert',
+        help='способ записи в БД: идемпотентный upsert, ORM или COPY'
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='заново загрузить все отчёты, игнорируя журнал загрузки'
+    )
+    parser.add_argument(
+        '--spool',
+        action='store_true',
+        help='сохранять скачанные файлы в excel_files вместо памяти'
+    )
+    parser.add_argument(
+        '--parse-mode',
+        choices=PARSE_POOLS,
+        default='thread',
+        help='парсить XLS в пуле потоков или в пуле процессов'
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=None,
+        help='число воркеров парсинга (по умолчанию по числу ядер)'
+    )
+    parser.add_argument(
+        '--download-workers',
+        type=int,
+        default=10,
+        help='максимум одновременных скачиваний для AIMD лимита'
+    )
+    parser.add_argument(
+        '--write-workers',
+        type=int,
+        default=2,
+        help='число одновременных транзакций записи в БД'
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=None,
+        help='размер очереди перед каждой стадией (по умолчанию 2x воркеров)'
+    )
+    parser.add_argument(
+        '--page-window',
+        type=int,
+        default=constants.PAGE_WINDOW,
+        help='число страниц результатов, запрашиваемых одновременно'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='не использовать локальный кеш скачанных отчётов'
+    )
+    parser.add_argument(
+        '--partitioned',
+        action='store_true',
+        help='создать таблицу итогов секционированной по месяцам'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help='файл метрик в текстовом формате Prometheus'
+    )
+    parser.add_argument(
+        '--summary-file',
+        default=os.path.join(os.path.dirname(__file__), 'run_summary.json'),
+        help='JSON отчёт о запуске по стадиям'
+    )
+    parser.add_argument(
+        '--since',
+        type=date.fromisoformat,
+        default=constants.REPORTS_SINCE,
+        help='загружать отчёты не раньше даты ГГГГ-ММ-ДД'
+    )
+    parser.add_argument(
+        '--until',
+        type=date.fromisoformat,
+        default=None,
+        help='загружать отчёты не позже даты ГГГГ-ММ-ДД'
+    )
+    args = parser.parse_args()
     # Асинхронно парсер отработал за 20 сек
     # Синхронно database.task02.parser.py 13 мин
     t0 = time.time()
-    asyncio.run(main())
+    status = asyncio.run(main(
+        loader=args.loader,
+        incremental=not args.full,
+        in_memory=not args.spool,
+        parse_mode=args.parse_mode,
+        parse_workers=args.parse_workers,
+        download_workers=args.download_workers,
+        write_workers=args.write_workers,
+        queue_size=args.queue_size,
+        page_window=args.page_window,
+        use_cache=not args.no_cache,
+        partitioned=args.partitioned,
+        metrics_file=args.metrics_file,
+        summary_file=args.summary_file,
+        since=args.since,
+        until=args.until
+    ))
     print(time.time() - t0)
+    sys.exit(status)
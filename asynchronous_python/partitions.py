@@ -0,0 +1,68 @@
+"""
+RANGE секционирование таблиц по месяцам.
+
+Общие части DatabaseConfig асинхронного парсера и database/task_01.
+Секционируются таблицы, у которых в info указан partition_by,
+месячные секции создаются по мере записи, а строки месяцев без своей
+секции попадают в секцию DEFAULT.
+"""
+from datetime import date
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, text
+
+
+# Секционированные таблицы БД и колонки, по которым они секционированы
+PARTITIONED_TABLES = text(
+    "SELECT c.relname, a.attname "
+    "FROM pg_partitioned_table p "
+    "JOIN pg_class c ON c.oid = p.partrelid "
+    "JOIN pg_attribute a ON a.attrelid = p.partrelid "
+    "AND a.attnum = p.partattrs[0]"
+)
+
+
+def partitioned_copy(table):
+    """Копия таблицы с RANGE секционированием по partition_by"""
+    column = table.info['partition_by']
+    partitioned = table.to_metadata(MetaData())
+    # Ключ секционирования обязан входить в первичный ключ. Флаг
+    # primary_key снимается с колонок, иначе новый ключ вызовет SAWarning
+    names = [c.name for c in partitioned.primary_key.columns]
+    for c in partitioned.primary_key.columns:
+        c.primary_key = False
+    partitioned.append_constraint(PrimaryKeyConstraint(*names, column))
+    partitioned.dialect_options['postgresql']['partition_by'] = (
+        f'RANGE ({column})'
+    )
+    return partitioned
+
+
+def create_partitioned_tables(conn, metadata):
+    """Создаёт таблицы metadata с partition_by и их секции DEFAULT"""
+    for table in metadata.sorted_tables:
+        if table.info.get('partition_by') is None:
+            continue
+        partitioned_copy(table).create(conn, checkfirst=True)
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {table.name}_default '
+            f'PARTITION OF {table.name} DEFAULT'
+        ))
+
+
+def missing_partitions(table_name, dates, created):
+    """Месяцы дат dates без секции в created: [(таблица, год, месяц)]"""
+    return sorted({
+        (table_name, day.year, day.month)
+        for day in dates if day is not None
+    } - created)
+
+
+def create_partition(table_name, year, month):
+    """Запрос создания месячной секции таблицы"""
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return text(
+        f'CREATE TABLE IF NOT EXISTS {table_name}_{year}_{month:02d} '
+        f'PARTITION OF {table_name} '
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    )
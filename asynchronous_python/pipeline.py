@@ -0,0 +1,94 @@
+import asyncio
+
+
+_DONE = object()
+
+
+class Stage:
+    """Стадия конвейера: обработчик и число его воркеров"""
+
+    def __init__(self, name, handler, workers=1, queue_size=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size or workers * 2)
+        self.errors = 0
+
+
+class Pipeline:
+    """
+    Конвейер из стадий, связанных ограниченными очередями.
+
+    Каждая стадия забирает элементы из своей очереди и кладёт результат
+    обработчика в очередь следующей стадии. Очереди ограничены, поэтому
+    медленная стадия останавливает все стадии перед собой, а число
+    элементов в работе не зависит от размера входных данных.
+    Если обработчик вернул None, элемент дальше не передаётся.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add_stage(self, name, handler, workers=1, queue_size=None):
+        """Добавляет стадию в конец конвейера"""
+        self.stages.append(Stage(name, handler, workers, queue_size))
+        return self
+
+    def queue_depths(self):
+        """Текущее число элементов в очереди каждой стадии"""
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    async def _feed(self, source):
+        """Перекладывает элементы источника в очередь первой стадии"""
+        queue = self.stages[0].queue
+        async for item in source:
+            await queue.put(item)
+
+    async def _work(self, index):
+        """Воркер стадии с номером index"""
+        stage = self.stages[index]
+        next_queue = (
+            self.stages[index + 1].queue
+            if index + 1 < len(self.stages) else None
+        )
+        while True:
+            item = await stage.queue.get()
+            if item is _DONE:
+                return
+            try:
+                result = await stage.handler(item)
+            except Exception as e:
+                stage.errors += 1
+                print(f'Ошибка на стадии {stage.name}: {e}')
+                continue
+            if result is not None and next_queue is not None:
+                await next_queue.put(result)
+
+    async def _run_stage(self, index):
+        """Запускает воркеров стадии и завершает следующую стадию"""
+        stage = self.stages[index]
+        await asyncio.gather(*[
+            self._work(index) for _ in range(stage.workers)
+        ])
+        if index + 1 < len(self.stages):
+            await self._close(index + 1)
+
+    async def _close(self, index):
+        """Сообщает всем воркерам стадии, что данных больше не будет"""
+        stage = self.stages[index]
+        for _ in range(stage.workers):
+            await stage.queue.put(_DONE)
+
+    async def run(self, source):
+        """Прогоняет асинхронный источник source через все стадии"""
+        tasks = [
+            asyncio.create_task(self._run_stage(index))
+            for index in range(len(self.stages))
+        ]
+        try:
+            await self._feed(source)
+            await self._close(0)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,251 @@
+import os
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from db_config import db_config
+from models import (
+    SpimexDailyBasisTotal,
+    SpimexDailyOilTotal,
+    SpimexDailyTotal,
+    SpimexDataVersion,
+    SpimexTraidingResult
+)
+
+load_dotenv()
+
+
+class QueryCache:
+    """
+    LRU кеш результатов запросов с ограничением времени жизни.
+
+    Считает попадания и промахи, чтобы по hit rate подбирать размер.
+    Парсер пишет в другом процессе, поэтому кеш сбрасывается, когда
+    меняется версия данных из spimex_data_version, см. check_version.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or int(os.getenv('QUERY_CACHE_SIZE', '1024'))
+        self.ttl = ttl or float(os.getenv('QUERY_CACHE_TTL', '300'))
+        # Версия данных проверяется не чаще раза в check_interval секунд
+        self.check_interval = float(
+            os.getenv('QUERY_CACHE_CHECK_INTERVAL', '1')
+        )
+        self.version = None
+        self.checked = None
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Значение по ключу или None, если его нет или оно устарело"""
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._data.pop(key, None)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self):
+        """Сбрасывает кеш, например после записи нового отчёта"""
+        self._data.clear()
+        self.invalidations += 1
+
+    def set_version(self, version):
+        """Запоминает версию данных и сбрасывает кеш, если она новая"""
+        if self.version is not None and version != self.version:
+            self.invalidate()
+        self.version = version
+        self.checked = time.monotonic()
+
+    def stats(self):
+        """Статистика попаданий для подбора размера кеша"""
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'invalidations': self.invalidations,
+        }
+
+
+query_cache = QueryCache()
+
+
+async def check_version():
+    """Сбрасывает query_cache, если с прошлой проверки записаны данные"""
+    if (
+        query_cache.checked is not None
+        and time.monotonic() - query_cache.checked
+        < query_cache.check_interval
+    ):
+        return
+    async with db_config.async_session() as db:
+        version = await db.scalar(
+            select(SpimexDataVersion.version)
+            .where(SpimexDataVersion.id == 1)
+        )
+    query_cache.set_version(version or 0)
+
+
+async def bump_version(db):
+    """Увеличивает версию данных в транзакции записи db"""
+    statement = insert(SpimexDataVersion).values(id=1, version=1)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={'version': SpimexDataVersion.version + 1}
+    ))
+
+
+def cached(function):
+    """Кеширует результат асинхронного запроса в query_cache"""
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        await check_version()
+        key = (function.__name__, args, tuple(sorted(kwargs.items())))
+        result = query_cache.get(key)
+        if result is None:
+            result = await function(*args, **kwargs)
+            query_cache.set(key, result)
+        return result
+    return wrapper
+
+
+def _filter(statement, oil_id, delivery_type_id, delivery_basis_id):
+    """Добавляет к запросу необязательные фильтры по продукту"""
+    if oil_id is not None:
+        statement = statement.where(SpimexTraidingResult.oil_id == oil_id)
+    if delivery_type_id is not None:
+        statement = statement.where(
+            SpimexTraidingResult.delivery_type_id == delivery_type_id
+        )
+    if delivery_basis_id is not None:
+        statement = statement.where(
+            SpimexTraidingResult.delivery_basis_id == delivery_basis_id
+        )
+    return statement
+
+
+@cached
+async def get_last_trading_dates(count):
+    """Последние count дат торгов, от новых к старым"""
+    async with db_config.async_session() as db:
+        result = await db.execute(
+            select(SpimexTraidingResult.date)
+            .distinct()
+            .order_by(SpimexTraidingResult.date.desc())
+            .limit(count)
+        )
+        return tuple(result.scalars().all())
+
+
+def _aggregate(oil_id, delivery_type_id, delivery_basis_id):
+    """
+    Таблица дневных агрегатов для набора фильтров или None.
+
+    Агрегаты есть для всех строк дня, по oil_id и по базису, другие
+    сочетания фильтров считаются по сырым строкам.
+    """
+    if delivery_type_id is not None:
+        return None
+    if oil_id is None and delivery_basis_id is None:
+        return SpimexDailyTotal, None
+    if delivery_basis_id is None:
+        return SpimexDailyOilTotal, SpimexDailyOilTotal.oil_id == oil_id
+    if oil_id is None:
+        return SpimexDailyBasisTotal, (
+            SpimexDailyBasisTotal.delivery_basis_id == delivery_basis_id
+        )
+    return None
+
+
+@cached
+async def get_dynamics(
+    start_date,
+    end_date,
+    oil_id=None,
+    delivery_type_id=None,
+    delivery_basis_id=None
+):
+    """
+    Объём, сумма и число договоров по дням за период.
+
+    Без фильтров и с одним фильтром по oil_id или базису читаются
+    дневные агрегаты spimex_daily_*: по строке на день вместо всех
+    строк периода. Агрегаты ведёт асинхронный парсер, после загрузки
+    другим способом их нужно пересчитать (aggregates.py rebuild).
+    """
+    aggregate = _aggregate(oil_id, delivery_type_id, delivery_basis_id)
+    if aggregate is not None:
+        model, condition = aggregate
+        statement = select(
+            model.date, model.volume, model.total, model.count
+        ).where(
+            model.date >= start_date,
+            model.date <= end_date,
+            model.rows > 0,
+        ).order_by(model.date)
+        if condition is not None:
+            statement = statement.where(condition)
+        async with db_config.async_session() as db:
+            result = await db.execute(statement)
+            return tuple(tuple(row) for row in result.all())
+    statement = _filter(
+        select(
+            SpimexTraidingResult.date,
+            func.sum(SpimexTraidingResult.volume).label('volume'),
+            func.sum(SpimexTraidingResult.total).label('total'),
+            func.sum(SpimexTraidingResult.count).label('count'),
+        ).where(
+            SpimexTraidingResult.date >= start_date,
+            SpimexTraidingResult.date <= end_date,
+        ),
+        oil_id,
+        delivery_type_id,
+        delivery_basis_id
+    ).group_by(
+        SpimexTraidingResult.date
+    ).order_by(
+        SpimexTraidingResult.date
+    )
+    async with db_config.async_session() as db:
+        result = await db.execute(statement)
+        return tuple(tuple(row) for row in result.all())
+
+
+@cached
+async def get_trading_results(
+    oil_id=None,
+    delivery_type_id=None,
+    delivery_basis_id=None
+):
+    """Итоги последней даты торгов с необязательными фильтрами"""
+    last_date = (
+        select(func.max(SpimexTraidingResult.date)).scalar_subquery()
+    )
+    statement = _filter(
+        select(SpimexTraidingResult).where(
+            SpimexTraidingResult.date == last_date
+        ),
+        oil_id,
+        delivery_type_id,
+        delivery_basis_id
+    ).order_by(SpimexTraidingResult.exchange_product_id)
+    async with db_config.async_session() as db:
+        result = await db.execute(statement)
+        return tuple(result.scalars().all())
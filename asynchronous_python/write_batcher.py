@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import constants
+from metrics import metrics
+
+
+class WriteBatcher:
+    """
+    Объединение отчётов нескольких файлов в общие транзакции записи.
+
+    Отчёты копятся, пока их меньше max_reports и строк меньше max_rows,
+    и записываются одним вызовом write(items) не позже чем через
+    interval секунд после первого отчёта пакета. Отчёт целиком входит
+    в один пакет, поэтому журнал загрузки и строки отчёта фиксируются
+    вместе. После фиксации ссылки пакета передаются в on_commit.
+    Если пакет не записался, его отчёты пишутся по одному, чтобы
+    ошибка одного файла не откатывала остальные.
+    """
+
+    def __init__(
+        self,
+        write,
+        max_reports=constants.LIMIT_SAVE,
+        max_rows=constants.BATCH_ROWS,
+        interval=constants.BATCH_INTERVAL,
+        on_commit=None
+    ):
+        self.write = write
+        self.max_reports = max_reports
+        self.max_rows = max_rows
+        self.interval = interval
+        self.on_commit = on_commit
+        self.pending = []
+        self.pending_rows = 0
+        self.started = None
+        self._timer = None
+        self._closing = asyncio.Event()
+
+    async def add(self, link, data):
+        """Добавляет строки отчёта link, при заполнении пишет пакет"""
+        self.pending.append((link, data))
+        self.pending_rows += len(data or ())
+        self.started = self.started or time.monotonic()
+        if (
+            len(self.pending) >= self.max_reports
+            or self.pending_rows >= self.max_rows
+        ):
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленный пакет"""
+        items = self.pending
+        if not items:
+            return
+        self.pending, self.pending_rows, self.started = [], 0, None
+        metrics.set_gauge('write_batch_reports', len(items))
+        if await self._write(items) or len(items) == 1:
+            return
+        for item in items:
+            await self._write([item])
+
+    async def _write(self, items):
+        """Одна транзакция записи; True, если пакет зафиксирован"""
+        links = [link for link, _ in items]
+        with metrics.track('bulk_save_data') as tracked:
+            try:
+                await self.write(items)
+            except Exception as e:
+                tracked.error = True
+                print(f'Ошибка записи пакета из {len(items)} файлов: {e}')
+                if len(items) == 1:
+                    metrics.record_failure('bulk_save_data', links[0][0], e)
+                return False
+            tracked.rows = sum(len(data or ()) for _, data in items)
+        if self.on_commit is not None:
+            self.on_commit(links)
+        return True
+
+    async def _tick(self):
+        """Пишет пакет, который ждёт дольше interval секунд"""
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._closing.wait(), self.interval / 2
+                )
+            except asyncio.TimeoutError:
+                pass
+            if (
+                self.started is not None
+                and time.monotonic() - self.started >= self.interval
+            ):
+                await self.flush()
+
+    def start(self):
+        self._timer = asyncio.create_task(self._tick())
+        return self
+
+    async def close(self):
+        """
+        Останавливает таймер и дописывает остаток.
+
+        Таймер не отменяется, а дожидается: отмена посреди flush
+        потеряла бы уже извлечённый пакет.
+        """
+        self._closing.set()
+        if self._timer is not None:
+            await self._timer
+        await self.flush()
@@ -0,0 +1,180 @@
+"""
+Сквозной замер обоих парсеров на локальной замене spimex.com.
+
+Поднимает SpimexStub, по очереди запускает asynchronous_python/pars.py и
+database/task_02/pars.py (последовательно и с --threads) против него
+и отдельной базы PostgreSQL и печатает пропускную способность
+по стадиям.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+import asyncpg
+
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from asynchronous_python.db_config import DatabaseConfig
+from spimex_stub import SpimexStub
+
+
+PARSERS = {
+    'async': (
+        project_root / 'asynchronous_python',
+        ['--full', '--no-cache'],
+    ),
+    'sync': (
+        project_root / 'database' / 'task_02',
+        [],
+    ),
+    'sync-threads': (
+        project_root / 'database' / 'task_02',
+        ['--threads', '10'],
+    ),
+}
+
+
+async def recreate_database(config, name):
+    """Удаляет базу замера, парсер создаст её заново"""
+    conn = await asyncpg.connect(
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        user=config.DB_USER,
+        password=config.DB_PASS,
+        database='postgres'
+    )
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS {name}')
+    finally:
+        await conn.close()
+
+
+async def count_rows(config, name):
+    """Число строк, записанных парсером в базу замера"""
+    try:
+        conn = await asyncpg.connect(
+            host=config.DB_HOST,
+            port=config.DB_PORT,
+            user=config.DB_USER,
+            password=config.DB_PASS,
+            database=name
+        )
+    except asyncpg.InvalidCatalogNameError:
+        return 0
+    try:
+        return await conn.fetchval(
+            'SELECT count(*) FROM spimex_trading_results'
+        )
+    finally:
+        await conn.close()
+
+
+def rate(amount, stats):
+    """Скорость по интервалу между первым и последним запросом"""
+    if not stats['first'] or stats['last'] == stats['first']:
+        return 0.0
+    return amount / (stats['last'] - stats['first'])
+
+
+async def run_parser(name, url, db_name, extra_args):
+    """
+    Запускает парсер и возвращает время работы, статистику сервера
+    и JSON отчёт парсера по стадиям.
+    """
+    cwd, args = PARSERS[name]
+    env = {**os.environ, 'SPIMEX_URL': url, 'DB_NAME': db_name}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        summary_file = os.path.join(tmp_dir, 'summary.json')
+        async with aiohttp.ClientSession() as http:
+            await http.post(f'{url}/stats/reset')
+            t0 = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, 'pars.py', *args, *extra_args,
+                '--summary-file', summary_file,
+                cwd=cwd,
+                env=env,
+                stdout=asyncio.subprocess.DEVNULL
+            )
+            await process.wait()
+            elapsed = time.perf_counter() - t0
+            async with http.get(f'{url}/stats') as response:
+                stats = await response.json()
+        try:
+            with open(summary_file, encoding='utf-8') as f:
+                summary = json.load(f)
+        except OSError:
+            summary = {'stages': {}}
+    return process.returncode, elapsed, stats, summary
+
+
+def report(name, returncode, elapsed, stats, rows, summary):
+    page, file = stats['page'], stats['file']
+    print(f'[{name}] код выхода {returncode}, {elapsed:.2f} сек')
+    print(
+        f'  поиск страниц: {page["requests"]} стр., '
+        f'{rate(page["requests"], page):.1f} стр/сек'
+    )
+    print(
+        f'  скачивание:    {file["requests"]} файлов, '
+        f'{rate(file["requests"], file):.1f} файл/сек, '
+        f'{rate(file["bytes"], file) / 2 ** 20:.2f} МБ/сек'
+    )
+    print(
+        f'  запись в БД:   {rows} строк, {rows / elapsed:,.0f} строк/сек '
+        'от начала запуска'
+    )
+    for stage_name, stage in summary['stages'].items():
+        print(
+            f'  {stage_name:<15} {stage["items"]:>6} вызовов, '
+            f'{stage["errors"]} ошибок, '
+            f'p50 {stage["latency_p50"]} сек, '
+            f'p95 {stage["latency_p95"]} сек, '
+            f'{stage["rows_per_second"]:,.0f} строк/сек'
+        )
+
+
+async def main(args):
+    config = DatabaseConfig()
+    stub = SpimexStub(args.files, args.rows, args.per_page, args.latency)
+    url = await stub.start(port=args.port)
+    try:
+        for name in args.parsers:
+            await recreate_database(config, args.db_name)
+            returncode, elapsed, stats, summary = await run_parser(
+                name, url, args.db_name, args.parser_args.get(name, [])
+            )
+            rows = await count_rows(config, args.db_name)
+            report(name, returncode, elapsed, stats, rows, summary)
+    finally:
+        await stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=300)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db-name', default='spimex_bench')
+    parser.add_argument(
+        '--parsers',
+        nargs='+',
+        choices=PARSERS,
+        default=list(PARSERS)
+    )
+    parser.add_argument(
+        '--async-args',
+        default='',
+        help='дополнительные аргументы asynchronous_python/pars.py'
+    )
+    args = parser.parse_args()
+    args.parser_args = {'async': args.async_args.split()}
+    asyncio.run(main(args))
@@ -0,0 +1,152 @@
+"""
+Локальная замена spimex.com для воспроизводимых замеров без сети.
+
+Отдаёт страницы результатов торгов в том же HTML виде, который разбирает
+get_links(), и синтетические файлы oil_xls_*.xls заданного числа и
+размера. Запускается отдельно или из run_e2e.py.
+"""
+import argparse
+import asyncio
+import io
+import random
+import time
+from datetime import date, timedelta
+
+import xlwt
+from aiohttp import web
+
+
+RESULTS_PATH = '/markets/oil_products/trades/results/'
+FILES_PATH = '/upload/reports/oil_xls/'
+
+
+def make_xls(day, rows, seed):
+    """Синтетический отчёт в разметке, которую ожидает parse_xls_sync"""
+    rnd = random.Random(seed)
+    book = xlwt.Workbook()
+    sheet = book.add_sheet('TRADE_SUMMARY')
+    sheet.write(3, 1, f'Дата торгов: {day:%d.%m.%Y}')
+    sheet.write(5, 1, 'Единица измерения: Метрическая тонна')
+    row = 8
+    for i in range(rows):
+        if i % 50 == 0:
+            sheet.write(row, 1, 'Секция Биржи: Нефтепродукты')
+            row += 1
+        oil_id = f'A{rnd.randint(0, 999):03d}'
+        basis_id = f'{rnd.choice("ABCDEFGHIJ")}{rnd.randint(0, 99):02d}'
+        product = f'{oil_id}{basis_id}{i % 1000:03d}{rnd.choice("AFW")}'
+        sheet.write(row, 1, product)
+        sheet.write(row, 2, f'Бензин {product}')
+        sheet.write(row, 3, f'Базис {basis_id}')
+        traded = rnd.random() > 0.3
+        sheet.write(row, 4, rnd.randint(60, 6000) if traded else '-')
+        sheet.write(row, 5, rnd.randint(10 ** 5, 10 ** 8) if traded else '-')
+        sheet.write(row, 14, rnd.randint(1, 20) if traded else '-')
+        row += 1
+    sheet.write(row, 1, 'Итого:')
+    buffer = io.BytesIO()
+    book.save(buffer)
+    return buffer.getvalue()
+
+
+class SpimexStub:
+    """HTTP сервер с пагинацией отчётов и счётчиками запросов"""
+
+    def __init__(
+        self,
+        files=200,
+        rows=300,
+        per_page=10,
+        latency=0.0,
+        last_day=date(2025, 6, 30)
+    ):
+        self.per_page = per_page
+        self.latency = latency
+        self.reports = {}
+        for i in range(files):
+            day = last_day - timedelta(days=i)
+            name = f'oil_xls_{day:%Y%m%d}162000.xls'
+            self.reports[name] = (i + 1, make_xls(day, rows, seed=i))
+        self.names = list(self.reports)
+        self.stats = {
+            kind: {'requests': 0, 'bytes': 0, 'first': None, 'last': None}
+            for kind in ('page', 'file')
+        }
+
+    def _count(self, kind, size):
+        stats = self.stats[kind]
+        now = time.perf_counter()
+        stats['requests'] += 1
+        stats['bytes'] += size
+        stats['first'] = stats['first'] or now
+        stats['last'] = now
+
+    async def results_page(self, request):
+        await asyncio.sleep(self.latency)
+        page = int(request.query.get('page', 'page-1').split('-')[1])
+        names = self.names[
+            (page - 1) * self.per_page:page * self.per_page
+        ]
+        links = ''.join(
+            f'<a class="accordeon-inner__item-title link xls" '
+            f'href="{FILES_PATH}{name}?r={self.reports[name][0]}">'
+            f'{name}</a>\n'
+            for name in names
+        )
+        html = f'<div class="accordeon-inner">\n{links}</div>'
+        self._count('page', len(html))
+        return web.Response(text=html, content_type='text/html')
+
+    async def report_file(self, request):
+        await asyncio.sleep(self.latency)
+        report = self.reports.get(request.match_info['name'])
+        if report is None:
+            raise web.HTTPNotFound()
+        self._count('file', len(report[1]))
+        return web.Response(
+            body=report[1],
+            content_type='application/vnd.ms-excel'
+        )
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def reset_stats(self, request):
+        for stats in self.stats.values():
+            stats.update(requests=0, bytes=0, first=None, last=None)
+        return web.json_response(self.stats)
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get(RESULTS_PATH, self.results_page)
+        app.router.add_get(FILES_PATH + '{name}', self.report_file)
+        app.router.add_get('/stats', self.get_stats)
+        app.router.add_post('/stats/reset', self.reset_stats)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """Запускает сервер в текущем цикле событий"""
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=300)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.0,
+        help='задержка ответа в секундах, имитирующая сеть'
+    )
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    stub = SpimexStub(args.files, args.rows, args.per_page, args.latency)
+    web.run_app(stub.make_app(), host='127.0.0.1', port=args.port)
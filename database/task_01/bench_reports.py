@@ -0,0 +1,133 @@
+import argparse
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import event, select
+
+from database import seed
+from db_config import db_config
+from models import Book, Buy, City, Client
+from reports import order_statuses, order_timelines, order_totals, revenue_by
+
+
+@contextmanager
+def count_queries(engine):
+    """Считает запросы, отправленные в БД внутри блока"""
+    counter = {'queries': 0}
+
+    def before_cursor_execute(*args):
+        counter['queries'] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def naive_order_totals(db):
+    """Суммы заказов обходом ленивых связей клиент -> заказ -> книга"""
+    totals = {}
+    for client in db.scalars(select(Client)):
+        buys = 0
+        total = 0
+        for buy in client.buys:
+            buys += 1
+            for buy_book in buy.buy_books:
+                total += buy_book.amount * buy_book.book.price
+        if buys:
+            totals[client.client_id] = (buys, total)
+    return totals
+
+
+def naive_timelines(db):
+    """Этапы заказов обходом ленивых связей заказ -> этап"""
+    return {
+        buy.buy_id: [
+            (buy_step.step.name_step, buy_step.date_step_beg)
+            for buy_step in buy.buy_steps
+        ]
+        for buy in db.scalars(select(Buy))
+    }
+
+
+def naive_revenue(db, dimension):
+    """Выручка по измерению обходом ленивых связей от книги"""
+    revenue = defaultdict(int)
+    if dimension == 'city':
+        for city in db.scalars(select(City)):
+            for client in city.clients:
+                for buy in client.buys:
+                    for buy_book in buy.buy_books:
+                        revenue[city.city_id] += (
+                            buy_book.amount * buy_book.book.price
+                        )
+        return revenue
+    for book in db.scalars(select(Book)):
+        key = getattr(book, dimension)
+        for buy_book in book.buy_books:
+            revenue[key] += buy_book.amount * book.price
+    return revenue
+
+
+REPORTS = {
+    'суммы по клиентам': (naive_order_totals, order_totals),
+    'этапы заказов': (naive_timelines, order_timelines),
+    'текущий этап': (naive_timelines, order_statuses),
+    **{
+        f'выручка: {dimension}': (
+            lambda db, d=dimension: naive_revenue(db, d),
+            lambda db, d=dimension: revenue_by(db, d),
+        )
+        for dimension in ('genre', 'author', 'city')
+    },
+}
+
+
+def measure(db, report):
+    """Время и число запросов отчёта на пустом identity map"""
+    db.expunge_all()
+    with count_queries(db_config.engine) as counter:
+        t0 = time.perf_counter()
+        report(db)
+        elapsed = time.perf_counter() - t0
+    return elapsed, counter['queries']
+
+
+def main(count, seed_value):
+    SessionLocal = db_config.init_db()
+    db_config.create_tables()
+    with SessionLocal() as db:
+        # Данные замера живут только в транзакции и откатываются
+        t0 = time.perf_counter()
+        seed(db, count, random.Random(seed_value))
+        db.flush()
+        print(f'Данные: {count} заказов за {time.perf_counter() - t0:.1f} сек')
+        try:
+            for name, (naive, report) in REPORTS.items():
+                naive_time, naive_queries = measure(db, naive)
+                report_time, report_queries = measure(db, report)
+                print(
+                    f'{name:<20} обход: {naive_queries:>7} запросов '
+                    f'{naive_time:8.3f} сек | отчёт: {report_queries:>3} '
+                    f'запросов {report_time:8.3f} сек'
+                )
+        finally:
+            db.rollback()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Отчёты по заказам против обхода ленивых связей'
+    )
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=5000,
+        help='число книг, клиентов и заказов в синтетических данных'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args.count, args.seed)
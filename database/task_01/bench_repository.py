@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select, update
+
+from database import seed
+from db_config import db_config
+from models import Book, Client, Step
+from repository import BuyRepository, OutOfStockError, place_order
+
+
+def make_orders(count, book_ids, client_ids, rnd):
+    """Синтетические заказы: клиент и 1-3 книги по одной штуке"""
+    return [
+        (
+            rnd.choice(client_ids),
+            {
+                book_id: 1
+                for book_id in rnd.sample(book_ids, rnd.randint(1, 3))
+            },
+        )
+        for _ in range(count)
+    ]
+
+
+def run_sync(orders, concurrency):
+    """
+    Заказы в пуле потоков, по сессии из пула движка на поток.
+
+    Первый этап читается один раз, как в BuyRepository.first_step_id.
+    """
+    with db_config.SessionLocal() as db:
+        step_id = db.scalar(select(func.min(Step.step_id)))
+
+    def place(order):
+        client_id, items = order
+        try:
+            with db_config.SessionLocal() as db:
+                with db.begin():
+                    place_order(db, client_id, items, '', step_id)
+            return True
+        except OutOfStockError:
+            return False
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return sum(pool.map(place, orders))
+
+
+async def run_async(orders, concurrency):
+    """Заказы корутинами, не больше concurrency одновременно"""
+    repository = BuyRepository()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def place(order):
+        async with semaphore:
+            try:
+                await repository.place_order(*order)
+                return True
+            except OutOfStockError:
+                return False
+
+    try:
+        return sum(await asyncio.gather(*[place(order) for order in orders]))
+    finally:
+        await db_config.async_engine.dispose()
+
+
+def report(name, orders, placed, elapsed):
+    print(
+        f'{name:>5}: {placed} заказов из {len(orders)} '
+        f'за {elapsed:.2f} сек, {len(orders) / elapsed:,.0f} заказов/сек'
+    )
+
+
+def main(count, concurrency, seed_value):
+    SessionLocal = db_config.init_db()
+    db_config.create_tables()
+    rnd = random.Random(seed_value)
+    with SessionLocal() as db:
+        if not db.scalar(select(func.count()).select_from(Book)):
+            seed(db, 1000, rnd)
+            db.commit()
+        # Замер пишет заказы в БД (запускать на отдельной DB_NAME),
+        # склад пополняется заранее, чтобы заказы не упирались в остаток
+        db.execute(
+            update(Book).values(amount=func.greatest(Book.amount, count))
+        )
+        db.commit()
+        book_ids = db.scalars(select(Book.book_id)).all()
+        client_ids = db.scalars(select(Client.client_id)).all()
+    orders = make_orders(count, book_ids, client_ids, rnd)
+    t0 = time.perf_counter()
+    placed = run_sync(orders, concurrency)
+    report('sync', orders, placed, time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    placed = asyncio.run(run_async(orders, concurrency))
+    report('async', orders, placed, time.perf_counter() - t0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Пропускная способность заказов: sync против async'
+    )
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=50,
+        help='одновременных заказов; размер пула задаётся DB_POOL_SIZE '
+             'и DB_MAX_OVERFLOW'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args.orders, args.concurrency, args.seed)
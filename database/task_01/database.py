@@ -1,3 +1,8 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
 from db_config import db_config
 from models import (
     Author,
@@ -12,11 +17,87 @@ from models import (
 )
 
 
-def main():
+STEPS = ('Оплата', 'Упаковка', 'Транспортировка', 'Доставка')
+
+
+def seed(db, count, rnd):
+    """
+    Каталог из count книг, клиентов и покупок через create_many.
+
+    На каждую таблицу уходит один INSERT ... RETURNING, связанные
+    записи ссылаются на полученные ключи.
+    """
+    genre_ids = Genre.create_many(
+        db, [{'name_genre': f'Жанр {i}'} for i in range(20)]
+    )
+    author_ids = Author.create_many(
+        db, [{'name_author': f'Автор {i}'} for i in range(count // 10 + 1)]
+    )
+    city_ids = City.create_many(db, [
+        {'name_city': f'Город {i}', 'days_delivery': rnd.randint(1, 30)}
+        for i in range(50)
+    ])
+    book_ids = Book.create_many(db, [
+        {
+            'title': f'Книга {i}',
+            'author_id': rnd.choice(author_ids),
+            'genre_id': rnd.choice(genre_ids),
+            'price': rnd.randint(100, 5000),
+            'amount': rnd.randint(0, 100),
+        }
+        for i in range(count)
+    ])
+    client_ids = Client.create_many(db, [
+        {
+            'name_client': f'Клиент {i}',
+            'city_id': rnd.choice(city_ids),
+            'email': f'client{i}@example.com',
+        }
+        for i in range(count)
+    ])
+    buy_ids = Buy.create_many(db, [
+        {
+            'buy_description': f'Заказ {i}',
+            'client_id': rnd.choice(client_ids),
+        }
+        for i in range(count)
+    ])
+    BuyBook.create_many(db, [
+        {
+            'buy_id': buy_id,
+            'book_id': book_id,
+            'amount': rnd.randint(1, 5),
+        }
+        for buy_id in buy_ids
+        for book_id in rnd.sample(book_ids, min(3, len(book_ids)))
+    ])
+    # Этапы передаются объектами: create_many сохранит их одним flush
+    steps = [Step(name_step=name) for name in STEPS]
+    buy_steps = []
+    for buy_id in buy_ids:
+        day = date(2025, 1, 1) + timedelta(days=rnd.randint(0, 364))
+        for step in steps:
+            end = day + timedelta(days=rnd.randint(0, 5))
+            buy_steps.append({
+                'buy_id': buy_id,
+                'step': step,
+                'date_step_beg': day,
+                'date_step_end': end,
+            })
+            day = end
+    BuyStep.create_many(db, buy_steps)
+
+
+def main(bulk=0, random_seed=0):
     try:
         SessionLocal = db_config.init_db()
         db_config.create_tables()
         with SessionLocal() as db:
+            if bulk:
+                seed(db, bulk, random.Random(random_seed))
+                db.commit()
+                print(f"Добавлено по {bulk} книг, клиентов и покупок")
+                return
             new_author = Author.create(db, name_author='Кирилл')
             new_genre = Genre.create(db, name_genre='Боевик')
             new_city = City.create(db, name_city='Иркутск', days_delivery=30)
@@ -61,4 +142,15 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Наполнение БД магазина')
+    parser.add_argument(
+        '--bulk',
+        type=int,
+        default=0,
+        help='добавить столько книг, клиентов и покупок через create_many'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    t0 = time.time()
+    main(args.bulk, args.seed)
+    print(time.time() - t0)
@@ -1,9 +1,22 @@
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 import psycopg2
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+project_root = Path(__file__).parent.parent.parent
+sys.path.append(str(project_root))
+
+from asynchronous_python.partitions import (
+    PARTITIONED_TABLES,
+    create_partition,
+    create_partitioned_tables,
+    missing_partitions
+)
+
 load_dotenv()
 
 
@@ -16,9 +29,20 @@ class DatabaseConfig:
         self.DB_USER = os.getenv('DB_USER', 'postgres')
         self.DB_PASS = os.getenv('DB_PASS', '')
         self.DB_NAME = os.getenv('DB_NAME', 'my_database')
+        self.POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+        self.MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        self.POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '0') == '1'
+        self.POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+        # 0 - не проверять наличие БД при старте (она уже создана)
+        self.CHECK_DATABASE = os.getenv('DB_CHECK_DATABASE', '1') == '1'
         self.Base = declarative_base()
-        self.engine = None
-        self.SessionLocal = None
+        self._engine = None
+        self._session_local = None
+        self._async_engine = None
+        self._async_session_local = None
+        self._database_checked = False
+        self.partitioned_tables = {}
+        self._partitions = set()
 
     def get_db_url(self, dbname=None):
         db = dbname or self.DB_NAME
@@ -57,23 +81,109 @@ class DatabaseConfig:
             if 'conn' in locals():
                 conn.close()
 
+    @property
+    def engine(self):
+        """
+        Движок создаётся при первом обращении.
+
+        Размер пула, pre-ping и recycle задаются переменными
+        окружения DB_*.
+        """
+        if self._engine is None:
+            self._engine = create_engine(
+                self.get_db_url(),
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.MAX_OVERFLOW,
+                pool_pre_ping=self.POOL_PRE_PING,
+                pool_recycle=self.POOL_RECYCLE
+            )
+        return self._engine
+
+    @property
+    def SessionLocal(self):
+        if self._session_local is None:
+            self._session_local = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=self.engine
+            )
+        return self._session_local
+
+    @property
+    def async_engine(self):
+        """
+        Асинхронный движок asyncpg с теми же настройками пула.
+
+        Нужен репозиториям (repository.py), создаётся при первом
+        обращении.
+        """
+        if self._async_engine is None:
+            self._async_engine = create_async_engine(
+                self.get_db_url().replace('+psycopg2', '+asyncpg'),
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.MAX_OVERFLOW,
+                pool_pre_ping=self.POOL_PRE_PING,
+                pool_recycle=self.POOL_RECYCLE
+            )
+        return self._async_engine
+
+    @property
+    def AsyncSessionLocal(self):
+        if self._async_session_local is None:
+            self._async_session_local = async_sessionmaker(
+                bind=self.async_engine,
+                expire_on_commit=False
+            )
+        return self._async_session_local
+
     def init_db(self):
-        """Инициализирует подключение к БД и создаёт таблицы"""
-        db_url = self.get_db_url()
-        self._ensure_database_exists()
-        self.engine = create_engine(db_url)
-        self.SessionLocal = sessionmaker(
-            autocommit=False,
-            autoflush=False,
-            bind=self.engine
-        )
+        """
+        Проверяет наличие БД и возвращает фабрику сессий.
+
+        Проверка выполняется один раз за процесс и отключается
+        DB_CHECK_DATABASE=0.
+        """
+        if self.CHECK_DATABASE and not self._database_checked:
+            self._ensure_database_exists()
+            self._database_checked = True
         return self.SessionLocal
 
-    def create_tables(self):
-        """Создаёт все таблицы в БД"""
-        if not self.engine:
-            self.init_db()
-        self.Base.metadata.create_all(bind=self.engine)
+    def create_tables(self, partitioned=False):
+        """
+        Создаёт все таблицы в БД.
+
+        При partitioned=True таблицы, у которых в info указан
+        partition_by, создаются секционированными по месяцам.
+        """
+        self.init_db()
+        with self.engine.begin() as conn:
+            if partitioned:
+                create_partitioned_tables(conn, self.Base.metadata)
+            self.Base.metadata.create_all(bind=conn)
+            self.partitioned_tables = dict(
+                conn.execute(PARTITIONED_TABLES).all()
+            )
+
+    def ensure_partitions(self, table_name, dates):
+        """
+        Создаёт недостающие месячные секции таблицы для дат dates.
+
+        Вызывается до транзакции записи: создание секции блокирует
+        родительскую таблицу.
+        """
+        if table_name not in self.partitioned_tables:
+            return
+        for key in missing_partitions(table_name, dates, self._partitions):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(create_partition(*key))
+            except Exception as e:
+                # Секцию мог одновременно создать другой поток, тогда
+                # IF NOT EXISTS сработает при следующей записи, а пока
+                # строки месяца попадут в секцию DEFAULT
+                print(f'Ошибка создания секции {key[1]}-{key[2]:02d}: {e}')
+                continue
+            self._partitions.add(key)
 
 
 db_config = DatabaseConfig()
@@ -0,0 +1,319 @@
+"""
+Генератор синтетических данных магазина для нагрузочных замеров.
+
+Таблицы заполняются через COPY (psycopg2 copy_expert) уровнями
+в порядке внешних ключей: справочники, затем книги и клиенты, заказы,
+строки и этапы заказов. Каждая таблица делится на диапазоны ключей,
+которые генерируются и загружаются параллельно в пуле процессов.
+Случайность детерминирована: диапазон получает генератор, засеянный
+(seed, таблица, начало диапазона).
+"""
+import argparse
+import bisect
+import itertools
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import date, timedelta
+from functools import lru_cache
+
+import psycopg2
+from sqlalchemy import func, select, text
+
+from db_config import db_config
+from models import (
+    Author,
+    Book,
+    Buy,
+    BuyBook,
+    BuyStep,
+    City,
+    Client,
+    Genre,
+    Step
+)
+
+
+STEPS = ('Оплата', 'Упаковка', 'Транспортировка', 'Доставка')
+START_DATE = date(2023, 1, 1)
+# Уровни загрузки: таблицы уровня ссылаются только на предыдущие
+LEVELS = (
+    (Genre, Author, City, Step),
+    (Book, Client),
+    (Buy,),
+    (BuyBook, BuyStep),
+)
+# Строки и этапы заказов получают ключи из последовательности,
+# остальные таблицы - явно, чтобы ссылки на них были известны заранее
+SERIAL_MODELS = (BuyBook, BuyStep)
+
+
+@lru_cache(maxsize=None)
+def zipf_weights(count, skew):
+    """Накопленные веса Ципфа: элемент ранга r выбирается ~ 1 / r^skew"""
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)
+    ))
+
+
+def zipf_id(rnd, first, count, skew):
+    """Ключ из [first, first + count) с популярностью по Ципфу"""
+    weights = zipf_weights(count, skew)
+    return first + bisect.bisect_left(weights, rnd.random() * weights[-1])
+
+
+def poisson(rnd, mean):
+    """Случайное число по Пуассону (метод Кнута, для малых mean)"""
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rnd.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def generate_rows(model, start, stop, config, offsets):
+    """Строки модели для ключей [start, stop) в порядке columns(model)"""
+    rnd = random.Random(f"{config['seed']}:{model.__tablename__}:{start}")
+    counts = config['counts']
+
+    def ref(target, skew=0.0):
+        first = offsets[target] + 1
+        if skew:
+            return zipf_id(rnd, first, counts[target], skew)
+        return rnd.randint(first, first + counts[target] - 1)
+
+    for pk in range(start, stop):
+        if model is Genre:
+            yield pk, f'Жанр {pk}'
+        elif model is Author:
+            yield pk, f'Автор {pk}'
+        elif model is City:
+            yield pk, f'Город {pk}', rnd.randint(1, 30)
+        elif model is Step:
+            yield pk, STEPS[pk - offsets['step'] - 1]
+        elif model is Book:
+            yield (
+                pk,
+                f'Книга {pk}',
+                ref('author'),
+                ref('genre', config['zipf']),
+                int(rnd.lognormvariate(6.5, 0.6)),
+                rnd.randint(0, 200),
+            )
+        elif model is Client:
+            yield (
+                pk,
+                f'Клиент {pk}',
+                ref('city', config['zipf']),
+                f'client{pk}@example.com',
+            )
+        elif model is Buy:
+            yield pk, f'Заказ {pk}', ref('client')
+        elif model is BuyBook:
+            for _ in range(1 + poisson(rnd, config['books_per_buy'] - 1)):
+                yield pk, ref('book', config['zipf']), rnd.randint(1, 5)
+        elif model is BuyStep:
+            day = START_DATE + timedelta(days=rnd.randint(0, 729))
+            done = rnd.random() >= config['active_share']
+            passed = len(STEPS) if done else rnd.randint(1, len(STEPS))
+            for index in range(passed):
+                finished = done or index < passed - 1
+                end = day + timedelta(days=rnd.randint(0, 5))
+                yield (
+                    pk,
+                    offsets['step'] + index + 1,
+                    day,
+                    end if finished else None,
+                )
+                day = end
+
+
+def columns(model):
+    """Колонки COPY: без ключа для SERIAL_MODELS"""
+    names = [column.name for column in model.__table__.columns]
+    if model in SERIAL_MODELS:
+        names = names[1:]
+    return names
+
+
+class RowReader:
+    """Файловый объект для copy_expert поверх генератора строк"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = bytearray()
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.count += 1
+            self.buffer += ('\t'.join(
+                r'\N' if value is None else str(value) for value in row
+            ) + '\n').encode()
+        size = len(self.buffer) if size < 0 else size
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+
+def load_range(model, start, stop, config, offsets):
+    """Генерирует и загружает диапазон ключей таблицы одним COPY"""
+    conn = psycopg2.connect(
+        host=db_config.DB_HOST,
+        port=db_config.DB_PORT,
+        user=db_config.DB_USER,
+        password=db_config.DB_PASS,
+        dbname=db_config.DB_NAME
+    )
+    try:
+        reader = RowReader(generate_rows(model, start, stop, config, offsets))
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {model.__tablename__} '
+                f"({', '.join(columns(model))}) FROM STDIN",
+                reader,
+                size=64 * 1024
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return model.__tablename__, reader.count
+
+
+def main(config, workers, chunk, truncate):
+    db_config.init_db()
+    db_config.create_tables()
+    models = [model for level in LEVELS for model in level]
+    with db_config.engine.begin() as conn:
+        if truncate:
+            conn.execute(text(
+                'TRUNCATE '
+                + ', '.join(model.__tablename__ for model in models)
+                + ' RESTART IDENTITY CASCADE'
+            ))
+        # Новые строки дописываются после уже существующих ключей
+        offsets = {
+            model.__tablename__: conn.execute(select(func.coalesce(
+                func.max(model.__mapper__.primary_key[0]), 0
+            ))).scalar()
+            for model in models
+        }
+    counts = config['counts']
+    totals = {}
+    with ProcessPoolExecutor(workers) as pool:
+        for level in LEVELS:
+            t0 = time.perf_counter()
+            futures = []
+            for model in level:
+                # Строки и этапы заказов делятся по ключам заказов
+                source = model.__tablename__
+                if model in SERIAL_MODELS:
+                    source = Buy.__tablename__
+                first = offsets[source] + 1
+                for start in range(first, first + counts[source], chunk):
+                    futures.append(pool.submit(
+                        load_range,
+                        model,
+                        start,
+                        min(start + chunk, first + counts[source]),
+                        config,
+                        offsets
+                    ))
+            wait(futures)
+            for future in futures:
+                table, count = future.result()
+                totals[table] = totals.get(table, 0) + count
+            print(
+                ', '.join(
+                    f'{model.__tablename__}: {totals[model.__tablename__]}'
+                    for model in level
+                )
+                + f' за {time.perf_counter() - t0:.1f} сек'
+            )
+    with db_config.engine.begin() as conn:
+        for model in models:
+            if model in SERIAL_MODELS:
+                continue
+            pk = model.__mapper__.primary_key[0].name
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence("
+                f"'{model.__tablename__}', '{pk}'), "
+                f'(SELECT coalesce(max({pk}), 0) + 1 '
+                f'FROM {model.__tablename__}), false)'
+            ))
+        for model in models:
+            conn.execute(text(f'ANALYZE {model.__tablename__}'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        '--buys',
+        type=int,
+        default=1_000_000,
+        help='число заказов; остальные таблицы по умолчанию от него'
+    )
+    parser.add_argument('--books', type=int, default=None)
+    parser.add_argument('--clients', type=int, default=None)
+    parser.add_argument('--authors', type=int, default=None)
+    parser.add_argument('--genres', type=int, default=50)
+    parser.add_argument('--cities', type=int, default=500)
+    parser.add_argument(
+        '--books-per-buy',
+        type=float,
+        default=2.5,
+        help='среднее число книг в заказе (не меньше 1)'
+    )
+    parser.add_argument(
+        '--zipf',
+        type=float,
+        default=0.8,
+        help='перекос популярности книг, жанров и городов (Ципф)'
+    )
+    parser.add_argument(
+        '--active-share',
+        type=float,
+        default=0.2,
+        help='доля заказов, прошедших не все этапы'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument(
+        '--chunk',
+        type=int,
+        default=100_000,
+        help='ключей в одном COPY'
+    )
+    parser.add_argument(
+        '--truncate',
+        action='store_true',
+        help='очистить таблицы перед загрузкой'
+    )
+    args = parser.parse_args()
+    t0 = time.time()
+    main(
+        {
+            'seed': args.seed,
+            'zipf': args.zipf,
+            'books_per_buy': max(args.books_per_buy, 1),
+            'active_share': args.active_share,
+            'counts': {
+                'genre': args.genres,
+                'author': args.authors or max(args.buys // 100, 1),
+                'city': args.cities,
+                'step': len(STEPS),
+                'book': args.books or max(args.buys // 10, 1),
+                'client': args.clients or max(args.buys // 5, 1),
+                'buy': args.buys,
+            },
+        },
+        args.workers,
+        args.chunk,
+        args.truncate
+    )
+    print(time.time() - t0)
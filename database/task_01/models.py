@@ -1,5 +1,13 @@
-from sqlalchemy import Column, Date, Integer, String, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    Date,
+    Integer,
+    String,
+    ForeignKey,
+    insert,
+    inspect
+)
+from sqlalchemy.orm import MANYTOONE, relationship
 
 from db_config import db_config
 
@@ -16,6 +24,52 @@ class BaseModel:
         session.flush()
         return obj
 
+    @classmethod
+    def create_many(cls, session, rows):
+        """
+        Создание многих объектов одним INSERT ... RETURNING.
+
+        rows - словари полей. Связанные объекты (author=, genre=, city=,
+        client=, ...) заменяются внешними ключами, ещё не сохранённые
+        из них записываются одним общим flush. Возвращает первичные
+        ключи в порядке rows.
+        """
+        if not rows:
+            return []
+        relationships = {
+            rel.key: rel
+            for rel in cls.__mapper__.relationships
+            if rel.direction is MANYTOONE
+        }
+        pending = {
+            id(obj): obj
+            for row in rows
+            for key in relationships.keys() & row.keys()
+            if (obj := row[key]) is not None
+            and inspect(obj).identity is None
+        }
+        if pending:
+            session.add_all(pending.values())
+            session.flush()
+        values = []
+        for row in rows:
+            row = dict(row)
+            for key in relationships.keys() & row.keys():
+                obj = row.pop(key)
+                rel = relationships[key]
+                for local, remote in rel.local_remote_pairs:
+                    attr = rel.mapper.get_property_by_column(remote).key
+                    row[local.key] = (
+                        None if obj is None else getattr(obj, attr)
+                    )
+            values.append(row)
+        primary_key = cls.__mapper__.primary_key[0]
+        result = session.execute(
+            insert(cls).returning(primary_key, sort_by_parameter_order=True),
+            values
+        )
+        return result.scalars().all()
+
 
 class Genre(Base, BaseModel):
     __tablename__ = 'genre'
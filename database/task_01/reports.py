@@ -0,0 +1,144 @@
+from sqlalchemy import distinct, func, select
+from sqlalchemy.orm import selectinload
+
+from models import (
+    Author,
+    Book,
+    Buy,
+    BuyBook,
+    BuyStep,
+    City,
+    Client,
+    Genre,
+    Step
+)
+
+
+# Измерение выручки: ключ, название и путь соединений от BuyBook
+REVENUE_DIMENSIONS = {
+    'genre': (Genre.genre_id, Genre.name_genre, (BuyBook.book, Book.genre)),
+    'author': (
+        Author.author_id,
+        Author.name_author,
+        (BuyBook.book, Book.author)
+    ),
+    'city': (
+        City.city_id,
+        City.name_city,
+        (BuyBook.book, BuyBook.buy, Buy.client, Client.city)
+    ),
+}
+
+
+def order_totals(db, limit=None):
+    """
+    Число заказов и их сумма по клиентам одним GROUP BY.
+
+    Возвращает (client_id, name_client, заказов, сумма) по убыванию
+    суммы.
+    """
+    total = func.sum(BuyBook.amount * Book.price).label('total')
+    statement = (
+        select(
+            Client.client_id,
+            Client.name_client,
+            func.count(distinct(Buy.buy_id)).label('buys'),
+            total
+        )
+        .join(Client.buys)
+        .join(Buy.buy_books)
+        .join(BuyBook.book)
+        .group_by(Client.client_id, Client.name_client)
+        .order_by(total.desc())
+        .limit(limit)
+    )
+    return db.execute(statement).all()
+
+
+def revenue_by(db, dimension):
+    """
+    Выручка по жанрам, авторам или городам одним GROUP BY.
+
+    Возвращает (ключ, название, выручка) по убыванию выручки.
+    """
+    key, name, joins = REVENUE_DIMENSIONS[dimension]
+    revenue = func.sum(BuyBook.amount * Book.price).label('revenue')
+    statement = select(key, name, revenue).select_from(BuyBook)
+    for relationship in joins:
+        statement = statement.join(relationship)
+    statement = statement.group_by(key, name).order_by(revenue.desc())
+    return db.execute(statement).all()
+
+
+def order_timelines(db, client_id=None, limit=None):
+    """
+    Этапы заказов в порядке дат.
+
+    Выполняется запрос заказов и по одному запросу этапов
+    (selectinload) вместе с названием этапа (joinedload) на каждые
+    500 заказов, а не запрос на каждый заказ.
+    Возвращает словарь
+    buy_id -> [(название этапа, начало, конец), ...].
+    """
+    statement = (
+        select(Buy)
+        .options(selectinload(Buy.buy_steps).joinedload(BuyStep.step))
+        .order_by(Buy.buy_id)
+        .limit(limit)
+    )
+    if client_id is not None:
+        statement = statement.where(Buy.client_id == client_id)
+    return {
+        buy.buy_id: [
+            (
+                buy_step.step.name_step,
+                buy_step.date_step_beg,
+                buy_step.date_step_end
+            )
+            for buy_step in sorted(
+                buy.buy_steps,
+                key=lambda buy_step: (
+                    buy_step.date_step_beg is None,
+                    buy_step.date_step_beg,
+                    buy_step.buy_step_id
+                )
+            )
+        ]
+        for buy in db.scalars(statement)
+    }
+
+
+def order_statuses(db):
+    """
+    Текущий этап каждого заказа одним запросом.
+
+    Текущим считается последний начатый этап: DISTINCT ON по заказу
+    с сортировкой по дате начала. Возвращает (buy_id, название этапа,
+    начало, конец).
+    """
+    statement = (
+        select(
+            BuyStep.buy_id,
+            BuyStep.step_id,
+            BuyStep.date_step_beg,
+            BuyStep.date_step_end
+        )
+        .where(BuyStep.date_step_beg.is_not(None))
+        .distinct(BuyStep.buy_id)
+        .order_by(
+            BuyStep.buy_id,
+            BuyStep.date_step_beg.desc(),
+            BuyStep.buy_step_id.desc()
+        )
+        .subquery()
+    )
+    return db.execute(
+        select(
+            statement.c.buy_id,
+            Step.name_step,
+            statement.c.date_step_beg,
+            statement.c.date_step_end
+        )
+        .join(Step, Step.step_id == statement.c.step_id)
+        .order_by(statement.c.buy_id)
+    ).all()
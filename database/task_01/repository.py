@@ -0,0 +1,264 @@
+import asyncio
+from datetime import date
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import selectinload
+
+from db_config import db_config
+from models import (
+    Author,
+    Book,
+    Buy,
+    BuyBook,
+    BuyStep,
+    City,
+    Client,
+    Genre,
+    Step
+)
+
+
+class OutOfStockError(Exception):
+    """На складе не хватает книг для заказа"""
+
+    def __init__(self, book_ids):
+        super().__init__(f'не хватает книг: {book_ids}')
+        self.book_ids = book_ids
+
+
+def place_order(db, client_id, items, description, step_id):
+    """
+    Заказ на синхронной сессии db в её текущей транзакции.
+
+    items - {book_id: количество}. Книги блокируются FOR UPDATE
+    в порядке ключей, поэтому одновременные заказы одних книг
+    ждут друг друга, а не взаимоблокируются. Списывает книги
+    со склада, создаёт заказ, его строки и этап step_id, если он
+    не None. Возвращает buy_id или бросает OutOfStockError,
+    а для пустого items - ValueError.
+    Асинхронный BuyRepository.place_order выполняет её через run_sync.
+    """
+    if not items:
+        raise ValueError('в заказе нет книг')
+    book = Book.__table__
+    stock = dict(db.execute(
+        select(book.c.book_id, book.c.amount)
+        .where(book.c.book_id.in_(items))
+        .order_by(book.c.book_id)
+        .with_for_update()
+    ).all())
+    missing = [
+        book_id for book_id, amount in items.items()
+        if stock.get(book_id, 0) < amount
+    ]
+    if missing:
+        raise OutOfStockError(missing)
+    db.execute(
+        update(book)
+        .where(book.c.book_id == bindparam('b_id'))
+        .values(amount=book.c.amount - bindparam('b_amount')),
+        [
+            {'b_id': book_id, 'b_amount': amount}
+            for book_id, amount in items.items()
+        ]
+    )
+    buy_id = db.scalar(
+        insert(Buy)
+        .values(buy_description=description, client_id=client_id)
+        .returning(Buy.buy_id)
+    )
+    db.execute(insert(BuyBook), [
+        {'buy_id': buy_id, 'book_id': book_id, 'amount': amount}
+        for book_id, amount in items.items()
+    ])
+    if step_id is not None:
+        db.execute(insert(BuyStep).values(
+            buy_id=buy_id,
+            step_id=step_id,
+            date_step_beg=date.today()
+        ))
+    return buy_id
+
+
+class BatchLoader:
+    """
+    Объединяет одновременные запросы по ключу в один WHERE pk IN (...).
+
+    Ключи, запрошенные корутинами за один проход цикла событий,
+    загружаются одним вызовом load_many(keys) -> {ключ: объект}.
+    """
+
+    def __init__(self, load_many):
+        self.load_many = load_many
+        self.pending = {}
+        self._task = None
+
+    async def load(self, key):
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[key] = future
+            if self._task is None:
+                self._task = asyncio.create_task(self._dispatch())
+        return await future
+
+    async def _dispatch(self):
+        pending, self.pending, self._task = self.pending, {}, None
+        try:
+            found = await self.load_many(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+class Repository:
+    """
+    Асинхронный CRUD модели model.
+
+    Каждая операция берёт свою сессию из пула async_engine, поэтому
+    репозиторий можно вызывать из многих корутин одновременно:
+    AsyncSession не разделяется между задачами. Возвращаемые объекты
+    отсоединены от сессии, связи нужно загружать явно.
+    """
+
+    model = None
+
+    def __init__(self, session_maker=None):
+        self.session_maker = session_maker or db_config.AsyncSessionLocal
+        self.loader = BatchLoader(self.get_many)
+
+    @property
+    def pk(self):
+        return self.model.__mapper__.primary_key[0]
+
+    async def get(self, pk):
+        """Объект по ключу; одновременные вызовы объединяются"""
+        return await self.loader.load(pk)
+
+    async def get_many(self, pks):
+        """Объекты по ключам одним запросом: {ключ: объект}"""
+        async with self.session_maker() as db:
+            result = await db.scalars(
+                select(self.model).where(self.pk.in_(pks))
+            )
+            return {getattr(obj, self.pk.key): obj for obj in result}
+
+    async def list(self, limit=100, offset=0, **filters):
+        """Страница объектов с фильтрами по равенству полей"""
+        async with self.session_maker() as db:
+            result = await db.scalars(
+                select(self.model)
+                .filter_by(**filters)
+                .order_by(self.pk)
+                .limit(limit)
+                .offset(offset)
+            )
+            return result.all()
+
+    async def create(self, **values):
+        async with self.session_maker() as db:
+            async with db.begin():
+                obj = self.model(**values)
+                db.add(obj)
+        return obj
+
+    async def create_many(self, rows):
+        """Много объектов одним INSERT ... RETURNING, см. create_many"""
+        async with self.session_maker() as db:
+            async with db.begin():
+                return await db.run_sync(
+                    lambda sync_db: self.model.create_many(sync_db, rows)
+                )
+
+    async def update(self, pk, **values):
+        """Изменяет поля объекта, False если его нет"""
+        async with self.session_maker() as db:
+            async with db.begin():
+                result = await db.execute(
+                    update(self.model)
+                    .where(self.pk == pk)
+                    .values(**values)
+                )
+        return result.rowcount > 0
+
+    async def delete(self, pk):
+        """Удаляет объект, False если его нет"""
+        async with self.session_maker() as db:
+            async with db.begin():
+                result = await db.execute(
+                    delete(self.model).where(self.pk == pk)
+                )
+        return result.rowcount > 0
+
+
+class GenreRepository(Repository):
+    model = Genre
+
+
+class AuthorRepository(Repository):
+    model = Author
+
+
+class CityRepository(Repository):
+    model = City
+
+
+class BookRepository(Repository):
+    model = Book
+
+
+class ClientRepository(Repository):
+    model = Client
+
+
+class StepRepository(Repository):
+    model = Step
+
+
+class BuyRepository(Repository):
+    model = Buy
+
+    def __init__(self, session_maker=None):
+        super().__init__(session_maker)
+        self._first_step_id = None
+
+    async def get_with_items(self, buy_id):
+        """Заказ с книгами и этапами, загруженными заранее"""
+        async with self.session_maker() as db:
+            return await db.scalar(
+                select(Buy)
+                .where(Buy.buy_id == buy_id)
+                .options(
+                    selectinload(Buy.buy_books).joinedload(BuyBook.book),
+                    selectinload(Buy.buy_steps).joinedload(BuyStep.step)
+                )
+            )
+
+    async def first_step_id(self, db):
+        """Первый этап заказа: справочник этапов читается один раз"""
+        if self._first_step_id is None:
+            self._first_step_id = await db.scalar(
+                select(func.min(Step.step_id))
+            )
+        return self._first_step_id
+
+    async def place_order(self, client_id, items, description=''):
+        """
+        Оформляет заказ в одной транзакции, см. place_order.
+
+        Возвращает buy_id или бросает OutOfStockError, а для пустого
+        items - ValueError до обращения к БД.
+        """
+        if not items:
+            raise ValueError('в заказе нет книг')
+        async with self.session_maker() as db:
+            async with db.begin():
+                step_id = await self.first_step_id(db)
+                return await db.run_sync(
+                    place_order, client_id, items, description, step_id
+                )
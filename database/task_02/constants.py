@@ -1,5 +1,9 @@
+from datetime import date
+
 UNIT_MEASURE = (5, 1)
 FIRST_COLUMN = 1
 COLUMN_CONTRACT = 14
 START_ROW = 8
 LIMIT_SAVE = 100
+# Отчёты старше имеют другую разметку, по умолчанию обход до них
+REPORTS_SINCE = date(2023, 1, 1)
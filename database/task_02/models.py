@@ -1,6 +1,14 @@
 import sys
 from pathlib import Path
-from sqlalchemy import Column, Date, DateTime, Integer, String
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint
+)
 from sqlalchemy.sql import func
 
 project_root = Path(__file__).parent.parent.parent
@@ -13,6 +21,26 @@ Base = db_config.Base
 
 class SpimexTraidingResult(Base):
     __tablename__ = 'spimex_trading_results'
+    __table_args__ = (
+        UniqueConstraint(
+            'exchange_product_id',
+            'date',
+            name='uq_spimex_trading_results_product_date'
+        ),
+        Index('ix_spimex_trading_results_date', 'date'),
+        Index('ix_spimex_trading_results_oil_date', 'oil_id', 'date'),
+        Index(
+            'ix_spimex_trading_results_basis_date',
+            'delivery_basis_id',
+            'date'
+        ),
+        Index(
+            'ix_spimex_trading_results_type_date',
+            'delivery_type_id',
+            'date'
+        ),
+        {'info': {'partition_by': 'date'}},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     exchange_product_id = Column(String, nullable=False)
     exchange_product_name = Column(String, nullable=False)
@@ -1,33 +1,107 @@
 import os
-from datetime import datetime
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime
 import time
 
 from urllib.request import urlopen, urlretrieve
 from urllib.error import URLError, HTTPError
 import xlrd
 import re
+import requests
+from psycopg2.extras import execute_values
+from requests.adapters import HTTPAdapter
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from urllib3.util.retry import Retry
 
 import constants
 from models import SpimexTraidingResult
+from asynchronous_python.metrics import metrics
 from database.task_01.db_config import db_config
 
 
-base_url = "https://spimex.com/markets/oil_products/trades/results/"
-url_files = "https://spimex.com"
+url_files = os.getenv('SPIMEX_URL', 'https://spimex.com')
+base_url = f"{url_files}/markets/oil_products/trades/results/"
 files_dir = os.path.join(os.path.dirname(__file__), 'excel_files')
 
+UNIQUE_KEY = 'uq_spimex_trading_results_product_date'
+UPSERT_CHUNK = 2000
+HTTP_TIMEOUT = (10, 60)
+RESULT_COLUMNS = (
+    'exchange_product_id',
+    'exchange_product_name',
+    'oil_id',
+    'delivery_basis_id',
+    'delivery_basis_name',
+    'delivery_type_id',
+    'volume',
+    'total',
+    'count',
+    'date',
+)
 
-def get_links():
+
+def create_http_session(pool_size: int):
+    """
+    Сессия requests с пулом keep-alive соединений на pool_size потоков.
+
+    Ответы 429/5xx и обрывы соединения повторяются с экспоненциальной
+    задержкой.
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504)
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def link_date(link):
+    """Дата отчёта из имени файла в ссылке"""
+    return datetime.strptime(link[1], "%Y%m%d").date()
+
+
+def get_links(session=None, since=constants.REPORTS_SINCE, until=None):
+    """
+    Генератор ссылок на отчёты с датой в [since, until].
+
+    Страницы идут от новых отчётов к старым, поэтому обход
+    заканчивается на первой странице, где все отчёты старше since.
+    """
     page_num: int = 1
     while True:
         url = f"{base_url}?page=page-{page_num}&bxajaxid=d609bce6ada86eff0b6f7e49e6bae904"
-        response = urlopen(url)
-        html = response.read().decode("utf-8")
-        pattern = r'href="(/upload/reports/oil_xls/oil_xls_20(2[3-9]|[3-9]\d)\d{10}\.xls\?r=\d+)'
-        links = re.findall(pattern, html)
+        with metrics.track('get_links') as tracked:
+            if session is None:
+                html = urlopen(url).read().decode("utf-8")
+            else:
+                response = session.get(url, timeout=HTTP_TIMEOUT)
+                response.raise_for_status()
+                html = response.text
+            pattern = r'href="(/upload/reports/oil_xls/oil_xls_(\d{8})\d{6}\.xls\?r=\d+)'
+            links = re.findall(pattern, html)
+            tracked.bytes = len(html)
+            tracked.rows = len(links)
         if not links:
             break
-        yield from links
+        dates = [link_date(link) for link in links]
+        for link, day in zip(links, dates):
+            if (since is None or day >= since) and (
+                until is None or day <= until
+            ):
+                yield link
+        if since is not None and max(dates) < since:
+            break
         page_num += 1
 
 
@@ -49,25 +123,155 @@ def upload_xls(link: str):
         print(f"Неизвестная ошибка: {str(e)}")
 
 
+def download_xls(session, link: str):
+    """
+    Скачивает отчёт в память через общую сессию.
+
+    Возвращает (дата, содержимое) или None, если файл не скачан.
+    """
+    date = datetime.strptime(
+        re.search(r"(\d{8})", link[0]).group(1),
+        "%Y%m%d"
+    ).date()
+    with metrics.track('upload_xls') as tracked:
+        try:
+            response = session.get(url_files + link[0], timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            tracked.error = True
+            metrics.record_failure('upload_xls', link[0], e)
+            print(f"Ошибка при скачивании {link[0]}: {e}")
+            return None
+        tracked.bytes = len(response.content)
+    print(f'Файл {link[0]} скачан')
+    return date, response.content
+
+
+def unique_rows(file_data: list) -> list:
+    """Строки без повторов (продукт, дата), побеждает последняя"""
+    return list({
+        (row['exchange_product_id'], row['date']): row
+        for row in file_data
+    }.values())
+
+
 def bulk_save_data(db, file_data: list):
+    """
+    Идемпотентное сохранение через INSERT ... ON CONFLICT DO UPDATE.
+
+    Строки с уже существующей парой (продукт, дата) обновляются вместе
+    с updated_on, поэтому повторный запуск не создаёт дублей.
+    """
     if file_data is not None:
+        rows: list = unique_rows(file_data)
+        db_config.ensure_partitions(
+            SpimexTraidingResult.__tablename__,
+            {row['date'] for row in rows}
+        )
+        statement = insert(SpimexTraidingResult)
+        statement = statement.on_conflict_do_update(
+            constraint=UNIQUE_KEY,
+            set_={
+                **{
+                    name: statement.excluded[name]
+                    for name in RESULT_COLUMNS
+                },
+                'updated_on': func.now(),
+            }
+        )
         try:
-            db.add_all(file_data)
+            # executemany одного запроса вместо INSERT ... VALUES
+            # с параметрами на каждое поле каждой строки
+            for start in range(0, len(rows), UPSERT_CHUNK):
+                db.execute(statement, rows[start:start + UPSERT_CHUNK])
             db.commit()
         except Exception as e:
             raise e
 
 
-def pars_xls(file_name) -> list:
-    file = os.path.join(files_dir, f"{file_name}")
-    wb = xlrd.open_workbook(file)
+def values_save_data(conn, file_data: list):
+    """
+    Upsert строк через psycopg2 execute_values на сыром соединении.
+
+    Пачка из UPSERT_CHUNK строк уходит одним INSERT ... VALUES без
+    построения ORM объектов и SQLAlchemy выражений. Фиксирует
+    транзакцию вызывающий.
+    """
+    if not file_data:
+        return
+    rows: list = unique_rows(file_data)
+    db_config.ensure_partitions(
+        SpimexTraidingResult.__tablename__,
+        {row['date'] for row in rows}
+    )
+    columns = ', '.join(RESULT_COLUMNS)
+    updates = ', '.join(
+        f'{name} = EXCLUDED.{name}' for name in RESULT_COLUMNS
+    )
+    template = '({}, now(), now())'.format(
+        ', '.join(f'%({name})s' for name in RESULT_COLUMNS)
+    )
+    with conn.cursor() as cursor:
+        execute_values(
+            cursor,
+            f'INSERT INTO {SpimexTraidingResult.__tablename__} '
+            f'({columns}, created_on, updated_on) VALUES %s '
+            f'ON CONFLICT ON CONSTRAINT {UNIQUE_KEY} '
+            f'DO UPDATE SET {updates}, updated_on = now()',
+            rows,
+            template=template,
+            page_size=UPSERT_CHUNK
+        )
+
+
+def bounded_map(executor, fn, items, window: int):
+    """
+    Ленивый executor.map: в работе не больше window задач.
+
+    Результаты отдаются в порядке items, поэтому следующая стадия
+    начинает работу, не дожидаясь окончания всей предыдущей.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def parse_report(item):
+    """
+    Разбор скачанного отчёта в процессе пула.
+
+    Возвращает (дата, строки, секунды разбора, ошибка): метрики
+    дочернего процесса в основной не попадают, поэтому время разбора
+    передаётся вместе с результатом.
+    """
+    date, contents = item
+    t0 = time.perf_counter()
+    error = None
+    try:
+        data = pars_xls(file_contents=contents)
+        if data is None:
+            error = ValueError('единица измерения не метрическая тонна')
+    except Exception as e:
+        data, error = None, e
+    return date, data, time.perf_counter() - t0, error
+
+
+def pars_xls(file_name=None, file_contents=None) -> list:
+    if file_contents is not None:
+        wb = xlrd.open_workbook(file_contents=file_contents)
+    else:
+        wb = xlrd.open_workbook(os.path.join(files_dir, f"{file_name}"))
     sheet = wb.sheet_by_index(0)
     date_str: str = sheet.cell_value(3, 1)[13:]
     try:
         date = datetime.strptime(date_str, "%d.%m.%Y").date()
     except ValueError:
         date = None
-    model_objects: list = []
+    results: list = []
     row: int = constants.START_ROW
     if (
         sheet.cell_value(
@@ -81,7 +285,7 @@ def pars_xls(file_name) -> list:
             if len(product) != 11 or count_contract == '-':
                 row += 1
                 continue
-            model_object = SpimexTraidingResult(
+            results.append(dict(
                 exchange_product_id=product,
                 exchange_product_name=sheet.cell_value(
                     row,
@@ -98,28 +302,172 @@ def pars_xls(file_name) -> list:
                 total=sheet.cell_value(row, constants.FIRST_COLUMN+4),
                 count=count_contract,
                 date=date
-            )
-            model_objects.append(model_object)
+            ))
             row += 1
-        return model_objects
+        return results
 
 
-def main():
-    SessionLocal = db_config.init_db()
-    db_config.create_tables()
+def run_serial(
+    SessionLocal,
+    metrics_file: str = None,
+    since=constants.REPORTS_SINCE,
+    until=None
+):
+    """Исходный режим: файл за файлом через excel_files и ORM сессию"""
     with SessionLocal() as db:
-        for link in get_links():
-            file_name = upload_xls(link)
-            data: list = pars_xls(f'{file_name}.xls')
-            bulk_save_data(db, data)
+        for link in get_links(since=since, until=until):
+            with metrics.track('upload_xls') as tracked:
+                file_name = upload_xls(link)
+                if file_name is None:
+                    tracked.error = True
+                    continue
+                tracked.bytes = os.path.getsize(
+                    os.path.join(files_dir, f'{file_name}.xls')
+                )
+            with metrics.track('parse_xls_sync') as tracked:
+                data: list = pars_xls(f'{file_name}.xls')
+                tracked.rows = len(data or ())
+            with metrics.track('bulk_save_data') as tracked:
+                bulk_save_data(db, data)
+                tracked.rows = len(data or ())
             print(f'Файл {file_name}.xls обработан')
+            if metrics_file:
+                metrics.write_prometheus(metrics_file)
     for filename in os.listdir(files_dir):
         if filename.endswith(".xls"):
             file_path = os.path.join(files_dir, filename)
             os.remove(file_path)
 
 
+def run_threaded(
+    threads: int,
+    parse_workers: int = None,
+    metrics_file: str = None,
+    since=constants.REPORTS_SINCE,
+    until=None
+):
+    """
+    Скачивание в пуле потоков, разбор в пуле процессов, запись пачками.
+
+    Стадии связаны через bounded_map, поэтому в памяти одновременно
+    не больше окна скачанных и разобранных отчётов. Запись идёт
+    в основном потоке через одно соединение из пула движка.
+    """
+    window = threads * 2
+    session = create_http_session(threads)
+    conn = db_config.engine.raw_connection()
+    try:
+        with ThreadPoolExecutor(threads) as downloads, \
+                ProcessPoolExecutor(parse_workers) as parsers:
+            downloaded = bounded_map(
+                downloads,
+                lambda link: download_xls(session, link),
+                get_links(session, since, until),
+                window
+            )
+            reports = (item for item in downloaded if item is not None)
+            for day, data, seconds, error in bounded_map(
+                parsers, parse_report, reports, window
+            ):
+                metrics.stage('parse_xls_sync').observe(
+                    seconds, rows=len(data or ()), error=error is not None
+                )
+                if error is not None:
+                    metrics.record_failure('parse_xls_sync', str(day), error)
+                    print(f"Ошибка разбора отчёта за {day}: {error}")
+                    continue
+                with metrics.track('bulk_save_data') as tracked:
+                    try:
+                        values_save_data(conn, data)
+                        conn.commit()
+                    except Exception as e:
+                        # Как в асинхронном парсере: ошибка одного отчёта
+                        # не останавливает загрузку остальных
+                        conn.rollback()
+                        tracked.error = True
+                        metrics.record_failure('bulk_save_data', str(day), e)
+                        print(f"Ошибка записи отчёта за {day}: {e}")
+                        continue
+                    tracked.rows = len(data)
+                print(f'Отчёт за {day} обработан')
+                if metrics_file:
+                    metrics.write_prometheus(metrics_file)
+    finally:
+        conn.close()
+        session.close()
+
+
+def main(
+    partitioned: bool = False,
+    metrics_file: str = None,
+    summary_file: str = None,
+    threads: int = 0,
+    parse_workers: int = None,
+    since=constants.REPORTS_SINCE,
+    until=None
+):
+    SessionLocal = db_config.init_db()
+    db_config.create_tables(partitioned)
+    if threads:
+        run_threaded(threads, parse_workers, metrics_file, since, until)
+    else:
+        run_serial(SessionLocal, metrics_file, since, until)
+    if metrics_file:
+        metrics.write_prometheus(metrics_file)
+    if summary_file:
+        metrics.write_summary(summary_file)
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Парсер итогов торгов SPIMEX')
+    parser.add_argument(
+        '--partitioned',
+        action='store_true',
+        help='создать таблицу итогов секционированной по месяцам'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help='файл метрик в текстовом формате Prometheus'
+    )
+    parser.add_argument(
+        '--summary-file',
+        default=os.path.join(os.path.dirname(__file__), 'run_summary.json'),
+        help='JSON отчёт о запуске по стадиям'
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=0,
+        help='число потоков скачивания; 0 - последовательный режим'
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=None,
+        help='число процессов разбора в режиме --threads'
+    )
+    parser.add_argument(
+        '--since',
+        type=date.fromisoformat,
+        default=constants.REPORTS_SINCE,
+        help='загружать отчёты не раньше даты ГГГГ-ММ-ДД'
+    )
+    parser.add_argument(
+        '--until',
+        type=date.fromisoformat,
+        default=None,
+        help='загружать отчёты не позже даты ГГГГ-ММ-ДД'
+    )
+    args = parser.parse_args()
     t0 = time.time()
-    main()
+    main(
+        args.partitioned,
+        args.metrics_file,
+        args.summary_file,
+        args.threads,
+        args.parse_workers,
+        args.since,
+        args.until
+    )
     print(time.time() - t0)